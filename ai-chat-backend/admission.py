@@ -0,0 +1,143 @@
+"""
+アドミッション制御（流量制御）
+対話系（/ask）と一括登録系（ingest）を別々のレーンで実行し、
+レーン毎に同時実行数・待ち行列長・待ち時間の上限を設けて過負荷時は即座に拒否する。
+一括登録系はバッチ毎に対話系の混雑を確認し、混雑中は処理を譲る
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import asyncio
+import functools
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict
+
+# サードパーティライブラリ
+from fastapi import HTTPException
+
+
+class AdmissionLane:
+    """
+    優先度レーン。
+    専用スレッドプールで処理を実行するため、別レーンの負荷にワーカーを奪われない。
+    - 待ち行列が max_queue に達している場合は 429 で即時拒否
+    - queue_timeout 秒以内に実行枠を得られなかった場合は 503 で拒否
+    いずれも Retry-After ヘッダに再試行までの目安秒数を付与する。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"lane-{name}")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # メトリクス
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.yields = 0
+        self.yield_wait_seconds = 0.0
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+        # 処理時間の指数移動平均（Retry-After の算出に使用）
+        self._service_time_ewma = 1.0
+
+    def retry_after(self) -> int:
+        """現在の待ち行列が捌けるまでの目安秒数"""
+        backlog = (self.waiting + self.running) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._service_time_ewma))
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """実行枠を確保してから func をレーン専用スレッドで実行する"""
+        queued_at = time.monotonic()
+        if self._semaphore.locked():
+            # 空き枠が無い場合のみ待ち行列に入る
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise self._reject(429, f"{self.name} の待ち行列が上限に達しています。しばらくしてから再試行してください")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise self._reject(503, f"{self.name} の待ち時間が上限を超えました。しばらくしてから再試行してください")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        started_at = time.monotonic()
+        self._wait_times.append(started_at - queued_at)
+        self.admitted += 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.running -= 1
+            self.completed += 1
+            elapsed = time.monotonic() - started_at
+            self._service_time_ewma = 0.8 * self._service_time_ewma + 0.2 * elapsed
+            self._semaphore.release()
+
+    def yield_to(self, other: "AdmissionLane", busy_threshold: int, max_wait: float, poll_interval: float = 0.01) -> None:
+        """
+        レーン専用スレッド内から呼び出し、other レーンの実行中＋待ち件数が busy_threshold 未満になるまで待つ。
+        CPUを分けられない環境でも、一括登録のバッチの合間に対話系へCPUを明け渡せる。
+        other が混雑し続けても登録が止まらないよう、1回あたり最長 max_wait 秒で処理を再開する。
+        """
+        if other.running + other.waiting < busy_threshold:
+            return
+        started_at = time.monotonic()
+        deadline = started_at + max_wait
+        while other.running + other.waiting >= busy_threshold and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+        self.yields += 1
+        self.yield_wait_seconds += time.monotonic() - started_at
+
+    def metrics(self) -> Dict[str, float]:
+        """待ち行列長・実行数・拒否数・待ち時間のメトリクス"""
+        wait_times = sorted(self._wait_times)
+        if wait_times:
+            p99_index = min(len(wait_times) - 1, math.ceil(len(wait_times) * 0.99) - 1)
+            avg_wait_ms = sum(wait_times) / len(wait_times) * 1000
+            p99_wait_ms = wait_times[p99_index] * 1000
+        else:
+            avg_wait_ms = p99_wait_ms = 0.0
+        return {
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "yields": self.yields,
+            "yield_wait_seconds": round(self.yield_wait_seconds, 3),
+            "avg_wait_ms": round(avg_wait_ms, 2),
+            "p99_wait_ms": round(p99_wait_ms, 2),
+            "avg_service_seconds": round(self._service_time_ewma, 3)
+        }
+
+    def shutdown(self) -> None:
+        """レーン専用スレッドプールを停止"""
+        self.executor.shutdown(wait=False)
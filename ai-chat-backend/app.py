@@ -10,12 +10,21 @@ PDF/TXTファイルのテキスト抽出、URLからの情報取得も含む
 # ライブラリインポート
 ###########################################################
 # 標準ライブラリ
+import math
 import os
 import re
 import shutil
+import threading
+import time
 import unicodedata
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Deque, List, Optional, Tuple
 from urllib.parse import urlparse
 
 # サードパーティライブラリ
@@ -23,20 +32,30 @@ import requests
 import weaviate
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, Form, HTTPException
 from pypdf import PdfReader
 from pydantic import BaseModel
-from weaviate.embedded import EmbeddedOptions
+from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
 
 # LangChain関連
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import Runnable
 from langchain_groq import ChatGroq
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain_weaviate import WeaviateVectorStore
 
+# アドミッション制御・スナップショット・Weaviateスキーマ・テナント
+from admission import AdmissionLane
+from snapshot import export_collection, import_snapshot, read_snapshot_info
+from tenant_store import TenantVectorStore, validate_tenant_name
+from weaviate_setup import connect_weaviate, ensure_collection
+
 
 # 環境変数の読み込み
 load_dotenv()
@@ -54,14 +73,41 @@ app = FastAPI(
 # リクエストモデルの定義
 ####################################
 
+class ChatMessage(BaseModel):
+    """会話履歴の1メッセージ"""
+    role: str
+    content: str
+
+
+class SearchFilters(BaseModel):
+    """検索対象を絞り込むメタデータ条件（指定した条件のみ適用）"""
+    source: Optional[str] = None
+    source_type: Optional[str] = None
+    language: Optional[str] = None
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
+
+
 class QueryRequest(BaseModel):
-    """RAG質問リクエスト"""
+    """
+    RAG質問リクエスト。
+    session_id を指定するとサーバー側の会話セッションを引き継ぐ。
+    conversation_history は新規セッションの初期履歴としてのみ使用する。
+    auto_language_filter が有効な場合、質問と同じ言語のチャンクに絞って検索する。
+    """
     question: str
+    session_id: Optional[str] = None
+    conversation_history: List[ChatMessage] = []
+    tenant: Optional[str] = None
+    filters: Optional[SearchFilters] = None
+    auto_language_filter: bool = True
 
 
 class IngestRequest(BaseModel):
     """テキスト直接保存リクエスト"""
     text: str
+    source: str = "ingest"
+    tenant: Optional[str] = None
 
 
 class UrlIngestRequest(BaseModel):
@@ -69,6 +115,13 @@ class UrlIngestRequest(BaseModel):
     url: str
     chunk_size: int = 1000
     preprocess: bool = True
+    tenant: Optional[str] = None
+
+
+class SnapshotRequest(BaseModel):
+    """スナップショットのエクスポート／インポートリクエスト"""
+    name: str
+    tenant: Optional[str] = None
 
 
 class FileIngestRequest(BaseModel):
@@ -76,67 +129,225 @@ class FileIngestRequest(BaseModel):
     directory_path: str
     chunk_size: int
     preprocess: bool
+    tenant: Optional[str] = None
 
 
 ####################################
 # 埋め込みモデルとベクトルストアの設定
 ####################################
 
-# 埋め込みモデルの初期化
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# 埋め込み・ベクトルストアのバックエンド
+# 負荷試験などでオフライン実行する場合は EMBEDDING_BACKEND=fake（または hashing）/ VECTOR_STORE_BACKEND=memory を指定
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "weaviate")
 
-# Weaviateクライアントの初期化
-try:
-    weaviate_url = os.getenv("WEAVIATE_URL", "http://localhost:8080")
-
-    # URLからホストとポートを抽出
-    if weaviate_url.startswith("http://"):
-        http_host = weaviate_url[7:]
-        http_secure = False
-    elif weaviate_url.startswith("https://"):
-        http_host = weaviate_url[8:]
-        http_secure = True
-    else:
-        http_host = weaviate_url
-        http_secure = False
+WEAVIATE_INDEX_NAME = os.getenv("WEAVIATE_INDEX_NAME", "DefaultIndex")
+# テナント別データを格納するマルチテナント用コレクション
+WEAVIATE_TENANT_INDEX_NAME = os.getenv("WEAVIATE_TENANT_INDEX_NAME", f"{WEAVIATE_INDEX_NAME}Tenants")
 
-    if ":" in http_host:
-        http_host, http_port = http_host.split(":")
-        http_port = int(http_port)
-    else:
-        http_port = 443 if http_secure else 80
 
-    client = weaviate.connect_to_local(
-        host=http_host,
-        port=http_port,
-        grpc_port=50051
-    )
-    print("既存のWeaviateインスタンスに接続しました")
-except Exception as e:
-    print(f"既存インスタンスへの接続に失敗しました: {e}")
-    try:
-        client = weaviate.WeaviateClient(
-            embedded_options=EmbeddedOptions(
-                hostname="localhost",
-                port=8090,
-                grpc_port=50052,
-                persistence_data_path="./weaviate_data"
-            )
+class ConditionWeaviateVectorStore(WeaviateVectorStore):
+    """
+    build_search_filter が返す検索条件を Weaviate のフィルタに変換して検索するベクトルストア。
+    テナント指定の保存では、テナントの存在は TenantRegistry が保証しているため
+    WeaviateVectorStore.add_texts の存在確認（全テナントの一覧取得）を行わずに直接投入する。
+    """
+
+    def add_texts(self, texts, metadatas=None, tenant=None, **kwargs):
+        if tenant is None:
+            return super().add_texts(texts, metadatas=metadatas, **kwargs)
+
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        objects = [
+            DataObject(properties={self._text_key: text, **(metadatas[i] if metadatas else {})}, vector=vector)
+            for i, (text, vector) in enumerate(zip(texts, vectors))
+        ]
+        result = self._collection.with_tenant(tenant).data.insert_many(objects)
+        for error in result.errors.values():
+            print(f"オブジェクトの保存に失敗しました: {error.message}")
+        return [str(object_id) for object_id in result.uuids.values()]
+
+    def similarity_search_by_vector(self, embedding, k=4, filters=None, **kwargs):
+        combined = None
+        for name, operator, value in filters or []:
+            condition = getattr(Filter.by_property(name), operator)(value)
+            combined = condition if combined is None else combined & condition
+        return super().similarity_search_by_vector(embedding, k=k, filters=combined, **kwargs)
+
+
+####################################
+# テナント管理
+####################################
+
+# キャッシュする（HOT状態に保つ）テナント数の上限
+TENANT_MAX_ACTIVE = int(os.getenv("TENANT_MAX_ACTIVE", "100"))
+# 最終利用からこの秒数を超えたテナントはCOLD（オフロード）に切り替える
+TENANT_IDLE_SECONDS = int(os.getenv("TENANT_IDLE_SECONDS", "600"))
+# 作成可能なテナント数の上限
+TENANT_MAX_TENANTS = int(os.getenv("TENANT_MAX_TENANTS", "1000"))
+# 1テナントあたりの保存可能チャンク数の上限
+TENANT_MAX_CHUNKS = int(os.getenv("TENANT_MAX_CHUNKS", "10000"))
+
+
+class TenantRegistry:
+    """
+    テナント別ベクトルストアハンドルのキャッシュ。
+    利用中のテナントはHOTに保ち、一定時間使われていないテナントや
+    キャッシュ上限を超えた古いテナントは、次回アクセス時に遅延してCOLDへオフロードする。
+    Weaviateとの通信はキャッシュ用ロックの外で行い、テナント毎のロックで
+    同一テナントの活性化とオフロードが競合しないようにする。
+    """
+
+    def __init__(
+        self,
+        store,
+        collection,
+        shared_store,
+        max_active: int,
+        idle_seconds: int,
+        max_tenants: int
+    ):
+        # store: マルチテナント用コレクションのベクトルストア / shared_store: テナント未指定時の共有インデックス
+        self.store = store
+        self.collection = collection
+        self.shared_store = shared_store
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self.max_tenants = max_tenants
+        self._handles: "OrderedDict[str, TenantVectorStore]" = OrderedDict()
+        self._tenant_locks: dict = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(self, tenant: Optional[str], create: bool = False):
+        """
+        テナントのベクトルストアを利用する。
+        テナント未指定時は共有インデックスのベクトルストアを返す。
+        create=True の場合、存在しないテナントを新規作成する。
+        with ブロックの間はそのテナントがオフロードされない。
+        """
+        if tenant is None:
+            yield self.shared_store
+            return
+        validate_tenant_name(tenant)
+
+        handle = self._acquire(tenant, create)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.in_use -= 1
+                handle.last_used = time.monotonic()
+
+    def _tenant_lock(self, tenant: str) -> threading.Lock:
+        with self._lock:
+            return self._tenant_locks.setdefault(tenant, threading.Lock())
+
+    def _hit(self, tenant: str) -> Optional[TenantVectorStore]:
+        """キャッシュ済みハンドルを利用中にして返す（呼び出し側でロック取得済み）"""
+        handle = self._handles.get(tenant)
+        if handle is not None:
+            self._handles.move_to_end(tenant)
+            handle.in_use += 1
+            handle.last_used = time.monotonic()
+        return handle
+
+    def _acquire(self, tenant: str, create: bool) -> TenantVectorStore:
+        with self._lock:
+            handle = self._hit(tenant)
+            evicted = self._collect_evictions()
+        try:
+            if handle is None:
+                with self._tenant_lock(tenant):
+                    with self._lock:
+                        handle = self._hit(tenant)
+                    if handle is None:
+                        handle = self._activate(tenant, create)
+                        with self._lock:
+                            handle.in_use += 1
+                            self._handles[tenant] = handle
+                            evicted += self._collect_evictions()
+            return handle
+        finally:
+            # 活性化に失敗した場合もキャッシュから外したテナントはオフロードする
+            for evicted_tenant in evicted:
+                self._offload(evicted_tenant)
+
+    def _collect_evictions(self) -> List[str]:
+        """
+        アイドル時間を超えたテナントと、上限を超えた古いテナントをキャッシュから外す。
+        利用中のハンドルは対象外（呼び出し側でロック取得済み）。
+        """
+        now = time.monotonic()
+        evicted = [
+            tenant for tenant, handle in self._handles.items()
+            if handle.in_use == 0 and now - handle.last_used >= self.idle_seconds
+        ]
+        for tenant in evicted:
+            del self._handles[tenant]
+        if len(self._handles) > self.max_active:
+            for tenant, handle in list(self._handles.items()):
+                if len(self._handles) <= self.max_active:
+                    break
+                if handle.in_use == 0:
+                    del self._handles[tenant]
+                    evicted.append(tenant)
+        return evicted
+
+    def _activate(self, tenant: str, create: bool) -> TenantVectorStore:
+        """テナントをHOT状態にしてハンドルを生成（テナント毎のロック取得済み）"""
+        existing = self.collection.tenants.get_by_name(tenant)
+
+        if existing is None:
+            if not create:
+                raise HTTPException(status_code=404, detail="指定されたテナントが見つかりません")
+            if len(self.collection.tenants.get()) >= self.max_tenants:
+                raise HTTPException(status_code=403, detail="テナント数の上限に達しています")
+            self.collection.tenants.create([Tenant(name=tenant)])
+            print(f"テナント {tenant} を作成しました")
+            return TenantVectorStore(self.store, tenant, 0)
+
+        # クライアントのバージョンにより HOT は ACTIVE として返される
+        if existing.activity_status.value not in ("HOT", "ACTIVE"):
+            self.collection.tenants.update([
+                Tenant(name=tenant, activity_status=TenantActivityStatus.HOT)
+            ])
+            print(f"テナント {tenant} をHOTに切り替えました")
+
+        chunk_count = self.collection.with_tenant(tenant).aggregate.over_all(total_count=True).total_count
+        return TenantVectorStore(self.store, tenant, chunk_count or 0)
+
+    def forget(self, tenant: str) -> None:
+        """未使用のキャッシュ済みハンドルを破棄（一括投入後にチャンク数を再取得させる）"""
+        with self._lock:
+            handle = self._handles.get(tenant)
+            if handle is not None and handle.in_use == 0:
+                del self._handles[tenant]
+
+    def _offload(self, tenant: str) -> None:
+        """テナントをCOLDに切り替えてメモリを解放（その間に再利用された場合は何もしない）"""
+        with self._tenant_lock(tenant):
+            with self._lock:
+                if tenant in self._handles:
+                    return
+            try:
+                self.collection.tenants.update([
+                    Tenant(name=tenant, activity_status=TenantActivityStatus.COLD)
+                ])
+                print(f"テナント {tenant} をCOLDに切り替えました")
+            except Exception as e:
+                print(f"テナント {tenant} のオフロードに失敗しました: {e}")
+
+
+def check_chunk_quota(store, additional: int) -> None:
+    """テナントの保存チャンク数が上限を超える場合は保存前に拒否する"""
+    if isinstance(store, TenantVectorStore) and store.chunk_count + additional > TENANT_MAX_CHUNKS:
+        raise HTTPException(
+            status_code=403,
+            detail=f"テナント {store.tenant} の保存チャンク数の上限（{TENANT_MAX_CHUNKS}）を超えます"
         )
-        print("Weaviateを組み込みモードで起動しました（ポート8090）")
-    except Exception as e:
-        print(f"組み込みモードの初期化にも失敗しました: {e}")
-        raise RuntimeError("Weaviateの初期化に完全に失敗しました")
-
-# ベクトルストアの初期化
-vector_store = WeaviateVectorStore(
-    client=client,
-    index_name=os.getenv("WEAVIATE_INDEX_NAME", "DefaultIndex"),
-    text_key="text",
-    embedding=embeddings
-)
+
 
 
 ####################################
@@ -148,6 +359,7 @@ def get_llm():
     環境変数 LLM_PROVIDER に基づいてLLMインスタンスを返す。
     毎回新規インスタンスを生成する（環境変数変更を反映させるため）。
     本番運用時は functools.lru_cache 等でのキャッシュを検討。
+    OPENAI_BASE_URL / GROQ_BASE_URL を指定すると互換APIサーバー（負荷試験用モック等）に接続する。
     """
     provider = os.getenv("LLM_PROVIDER", "groq")
 
@@ -155,19 +367,90 @@ def get_llm():
         return ChatOpenAI(
             model="gpt-4-turbo",
             temperature=0.5,
-            api_key=os.getenv("OPENAI_API_KEY")
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL")
         )
     elif provider == "groq":
         return ChatGroq(
             # model="llama3-70b-8192",  # 2025年8月30日に廃止
             model="openai/gpt-oss-120b",
             temperature=0.5,
-            api_key=os.getenv("GROQ_API_KEY")
+            api_key=os.getenv("GROQ_API_KEY"),
+            base_url=os.getenv("GROQ_BASE_URL")
         )
     else:
         raise ValueError(f"サポートされていないLLMプロバイダー: {provider}")
 
 
+####################################
+# バックエンドの組み立て
+####################################
+
+@dataclass
+class Backends:
+    """
+    埋め込み・ベクトルストア・LLM の提供元。
+    エンドポイントは get_backends を FastAPI の依存関係として受け取るため、
+    テストでは app.dependency_overrides で丸ごと差し替えられる。
+    """
+    embeddings: Embeddings
+    tenant_registry: object  # TenantRegistry または offline_backends.MemoryTenantRegistry
+    llm_factory: Callable[[], Runnable] = get_llm
+    client: Optional[weaviate.WeaviateClient] = None
+
+
+def create_backends() -> Backends:
+    """環境変数 EMBEDDING_BACKEND / VECTOR_STORE_BACKEND に従ってバックエンドを組み立てる"""
+    if EMBEDDING_BACKEND == "huggingface":
+        embeddings = HuggingFaceEmbeddings(
+            model_name="sentence-transformers/all-MiniLM-L6-v2"
+        )
+    else:
+        from offline_backends import create_embeddings
+        embeddings = create_embeddings(EMBEDDING_BACKEND)
+
+    if VECTOR_STORE_BACKEND == "memory":
+        from offline_backends import MemoryTenantRegistry
+        return Backends(
+            embeddings=embeddings,
+            tenant_registry=MemoryTenantRegistry(embedding=embeddings, max_tenants=TENANT_MAX_TENANTS)
+        )
+
+    client = connect_weaviate()
+    # 検索フィルタ用のプロパティを定義してからベクトルストアを初期化する
+    # （未作成のまま保存すると自動スキーマで全文検索用のプロパティが作られるため）
+    ensure_collection(client, WEAVIATE_INDEX_NAME)
+    ensure_collection(client, WEAVIATE_TENANT_INDEX_NAME, multi_tenancy=True)
+    shared_store = ConditionWeaviateVectorStore(
+        client=client,
+        index_name=WEAVIATE_INDEX_NAME,
+        text_key="text",
+        embedding=embeddings
+    )
+    tenant_store = ConditionWeaviateVectorStore(
+        client=client,
+        index_name=WEAVIATE_TENANT_INDEX_NAME,
+        text_key="text",
+        embedding=embeddings,
+        use_multi_tenancy=True
+    )
+    tenant_registry = TenantRegistry(
+        store=tenant_store,
+        collection=client.collections.get(WEAVIATE_TENANT_INDEX_NAME),
+        shared_store=shared_store,
+        max_active=TENANT_MAX_ACTIVE,
+        idle_seconds=TENANT_IDLE_SECONDS,
+        max_tenants=TENANT_MAX_TENANTS
+    )
+    return Backends(embeddings=embeddings, tenant_registry=tenant_registry, client=client)
+
+
+@lru_cache(maxsize=None)
+def get_backends() -> Backends:
+    """アプリ全体で共有するバックエンド（初回呼び出し時に生成）"""
+    return create_backends()
+
+
 ####################################
 # テキスト処理ユーティリティ
 ####################################
@@ -186,13 +469,21 @@ def detect_language(text: str) -> str:
 def get_prompt_template(language: str) -> str:
     """言語に応じたRAGプロンプトテンプレートを返す"""
     templates = {
-        'ja': """以下の文脈に基づいて質問に日本語で答えてください:
+        'ja': """以下の会話履歴と文脈に基づいて質問に日本語で答えてください:
+会話履歴:
+{history}
+
+文脈:
 {context}
 
 質問: {question}
 
 回答は日本語で、明確かつ簡潔にお願いします。""",
-        'en': """Answer the question based on the following context:
+        'en': """Answer the question based on the following conversation history and context:
+Conversation history:
+{history}
+
+Context:
 {context}
 
 Question: {question}
@@ -202,6 +493,71 @@ Please provide a clear and concise answer in English."""
     return templates.get(language, templates['en'])
 
 
+def get_condense_template(language: str) -> str:
+    """会話履歴を踏まえてフォローアップ質問を独立した検索クエリに言い換えるテンプレート"""
+    templates = {
+        'ja': """以下の会話履歴を踏まえて、最後のフォローアップ質問を、履歴を読まなくても意味が通じる独立した質問に書き換えてください。
+書き換えた質問のみを日本語で出力してください。
+
+会話履歴:
+{history}
+
+フォローアップ質問: {question}
+
+独立した質問:""",
+        'en': """Given the following conversation history, rewrite the follow-up question as a standalone question that can be understood without the history.
+Output only the rewritten question in English.
+
+Conversation history:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+    }
+    return templates.get(language, templates['en'])
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を簡易推定。
+    日本語文字は1文字≒1トークン、それ以外は4文字≒1トークンとして概算する。
+    """
+    ja_chars = len(re.findall(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text))
+    return ja_chars + math.ceil((len(text) - ja_chars) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """推定トークン数が max_tokens 以下になるよう末尾を切り詰める（二分探索）"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def build_chunk_metadatas(chunks: List[str], source: str, source_type: str) -> List[dict]:
+    """
+    チャンク毎の検索用メタデータを生成。
+    language はチャンク単位で判定し、ingested_at は RFC3339 形式で記録する。
+    """
+    ingested_at = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "language": detect_language(chunk),
+            "source": source,
+            "source_type": source_type,
+            "ingested_at": ingested_at
+        }
+        for chunk in chunks
+    ]
+
+
 def preprocess_text_txt(text: str) -> str:
     """TXT用テキスト前処理。不要な空白・改行を正規化"""
     text = re.sub(r'\s+', ' ', text).strip()
@@ -344,8 +700,8 @@ def extract_text_from_pdf(pdf_path: str) -> str:
 # ディレクトリ処理関数
 #####################################
 
-def process_pdf_directory(directory_path: str, chunk_size: int, preprocess: bool) -> List[str]:
-    """指定ディレクトリ内の全PDFを処理してチャンクリストを返す"""
+def process_pdf_directory(directory_path: str, chunk_size: int, preprocess: bool) -> Tuple[List[str], List[dict]]:
+    """指定ディレクトリ内の全PDFを処理してチャンクリストとメタデータリストを返す"""
     path = Path(directory_path)
     if not path.exists():
         raise HTTPException(status_code=404, detail="指定されたディレクトリが見つかりません")
@@ -355,7 +711,9 @@ def process_pdf_directory(directory_path: str, chunk_size: int, preprocess: bool
         raise HTTPException(status_code=404, detail="PDFファイルが見つかりません")
 
     pdf_chunks = []
+    pdf_metadatas = []
     for pdf_file in pdf_files:
+        yield_to_chat()
         try:
             text = extract_text_from_pdf(str(pdf_file))
             if not text.strip():
@@ -368,6 +726,7 @@ def process_pdf_directory(directory_path: str, chunk_size: int, preprocess: bool
             chunks = split_into_chunks_pdf(text, chunk_size)
             if chunks:
                 pdf_chunks.extend(chunks)
+                pdf_metadatas.extend(build_chunk_metadatas(chunks, pdf_file.name, "pdf"))
             else:
                 print(f"警告: ファイル {pdf_file.name} から有効なチャンクを生成できませんでした")
         except Exception as e:
@@ -377,11 +736,11 @@ def process_pdf_directory(directory_path: str, chunk_size: int, preprocess: bool
     if not pdf_chunks:
         raise HTTPException(status_code=500, detail="有効なテキストチャンクを生成できませんでした")
 
-    return pdf_chunks
+    return pdf_chunks, pdf_metadatas
 
 
-def process_txt_directory(directory_path: str, chunk_size: int, preprocess: bool) -> List[str]:
-    """指定ディレクトリ内の全TXTを処理してチャンクリストを返す"""
+def process_txt_directory(directory_path: str, chunk_size: int, preprocess: bool) -> Tuple[List[str], List[dict]]:
+    """指定ディレクトリ内の全TXTを処理してチャンクリストとメタデータリストを返す"""
     path = Path(directory_path)
     if not path.exists():
         raise HTTPException(status_code=404, detail="指定されたディレクトリが見つかりません")
@@ -391,7 +750,9 @@ def process_txt_directory(directory_path: str, chunk_size: int, preprocess: bool
         raise HTTPException(status_code=404, detail="TXTファイルが見つかりません")
 
     txt_chunks = []
+    txt_metadatas = []
     for txt_file in txt_files:
+        yield_to_chat()
         try:
             text = extract_text_from_txt(str(txt_file))
             if not text:
@@ -403,6 +764,7 @@ def process_txt_directory(directory_path: str, chunk_size: int, preprocess: bool
             chunks = split_into_chunks_txt(text, chunk_size)
             if chunks:
                 txt_chunks.extend(chunks)
+                txt_metadatas.extend(build_chunk_metadatas(chunks, txt_file.name, "txt"))
         except Exception as e:
             print(f"ファイル {txt_file.name} の処理中にエラーが発生しました: {e}")
             continue
@@ -410,32 +772,328 @@ def process_txt_directory(directory_path: str, chunk_size: int, preprocess: bool
     if not txt_chunks:
         raise HTTPException(status_code=500, detail="有効なテキストを抽出できませんでした")
 
-    return txt_chunks
+    return txt_chunks, txt_metadatas
+
+
+######################################
+# 会話セッション管理
+######################################
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))
+SESSION_MAX_MESSAGE_CHARS = int(os.getenv("SESSION_MAX_MESSAGE_CHARS", "2000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1000"))
+# 前回の検索クエリとの類似度がこの値以上なら前回の検索結果を再利用する
+TOPIC_REUSE_THRESHOLD = float(os.getenv("TOPIC_REUSE_THRESHOLD", "0.85"))
+
+
+@dataclass
+class ConversationSession:
+    """1会話分の履歴と直近の検索結果"""
+    turns: Deque[Tuple[str, str]]
+    tenant: Optional[str] = None
+    last_query_vector: Optional[List[float]] = None
+    last_filter_key: Optional[str] = None
+    last_docs: List[Document] = field(default_factory=list)
+    updated_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class SessionSnapshot:
+    """回答生成に使うセッション状態の読み取り用コピー"""
+    turns: List[Tuple[str, str]]
+    last_query_vector: Optional[List[float]]
+    last_filter_key: Optional[str]
+    last_docs: List[Document]
+
+
+class ConversationStore:
+    """
+    件数上限・TTL付きのインメモリ会話セッションストア。
+    各セッションは直近 max_turns 往復分のみ保持し、
+    上限を超えた場合は最も古く使われたセッションから破棄する。
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: int, max_turns: int):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        """TTL切れのセッションを古い順に破棄（呼び出し側でロック取得済み）"""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+
+    def get_or_create(
+        self,
+        session_id: Optional[str],
+        tenant: Optional[str] = None,
+        initial_history: Optional[List[ChatMessage]] = None
+    ) -> Tuple[str, ConversationSession]:
+        """
+        セッションを取得。存在しない場合は初期履歴付きで新規作成する。
+        未知・期限切れ・別テナントのセッションIDが指定された場合は引き継がず、
+        クライアント指定のIDは使わずに新しいIDを発行する。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            if session_id and session_id in self._sessions:
+                session = self._sessions[session_id]
+                if session.tenant == tenant:
+                    session.updated_at = now
+                    self._sessions.move_to_end(session_id)
+                    return session_id, session
+
+            session_id = uuid.uuid4().hex
+            session = ConversationSession(turns=deque(maxlen=self.max_turns * 2), tenant=tenant)
+            for message in initial_history or []:
+                session.turns.append((message.role, message.content[:SESSION_MAX_MESSAGE_CHARS]))
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session_id, session
+
+    def snapshot(self, session: ConversationSession) -> SessionSnapshot:
+        """同じセッションへの並行した record_turn と競合しないよう、ロック下で状態をコピーする"""
+        with self._lock:
+            return SessionSnapshot(
+                turns=list(session.turns),
+                last_query_vector=session.last_query_vector,
+                last_filter_key=session.last_filter_key,
+                last_docs=list(session.last_docs)
+            )
+
+    def record_turn(
+        self,
+        session: ConversationSession,
+        question: str,
+        answer: str,
+        query_vector: List[float],
+        filter_key: str,
+        docs: List[Document]
+    ) -> None:
+        """1往復分の履歴と今回の検索結果（検索条件を含む）を保存"""
+        with self._lock:
+            session.turns.append(("user", question[:SESSION_MAX_MESSAGE_CHARS]))
+            session.turns.append(("assistant", answer[:SESSION_MAX_MESSAGE_CHARS]))
+            session.last_query_vector = query_vector
+            session.last_filter_key = filter_key
+            session.last_docs = docs
+            session.updated_at = time.monotonic()
+
+    def delete(self, session_id: str) -> bool:
+        """セッションを削除。存在した場合は True を返す"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+conversation_store = ConversationStore(
+    max_sessions=SESSION_MAX_SESSIONS,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_turns=SESSION_MAX_TURNS
+)
+
+
+def format_history(turns: List[Tuple[str, str]], token_budget: int) -> str:
+    """
+    会話履歴をプロンプト用の文字列に整形。
+    新しい発言から順にトークン予算に収まる分だけ採用し、
+    会話が長くなってもプロンプト長（＝レイテンシ）が一定以下に保たれるようにする。
+    1発言は予算の半分までに切り詰めるため、長い回答があっても直近の質問と回答は必ず残る。
+    """
+    lines = []
+    used_tokens = 0
+    for role, content in reversed(turns):
+        prefix = f"{'User' if role == 'user' else 'Assistant'}: "
+        line = truncate_to_tokens(prefix + content, min(token_budget // 2, token_budget - used_tokens))
+        if len(line) <= len(prefix):
+            break
+        lines.append(line)
+        used_tokens += estimate_tokens(line)
+    return "\n".join(reversed(lines))
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """2つのベクトルのコサイン類似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
 
 
 ######################################
 # RAGチェーン設定
 ######################################
 
-# リトリーバーの設定（上位3件を取得）
-retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+# 検索件数（上位3件を取得）
+RETRIEVAL_K = 3
+
+
+def format_docs(docs: List[Document]) -> str:
+    """検索結果のドキュメントを文脈用の文字列に結合"""
+    return "\n\n".join(doc.page_content for doc in docs)
 
 
-def get_rag_chain(question: str):
+def build_search_filter(
+    filters: Optional[SearchFilters],
+    language: Optional[str]
+) -> Optional[List[Tuple[str, str, object]]]:
     """
-    質問の言語を検出し、言語に応じたプロンプトでRAGチェーンを構築。
+    メタデータ条件から (プロパティ名, 演算子, 値) の検索条件リストを構築。
+    言語条件は filters.language を優先し、未指定なら language（自動言語フィルタ）を使う。
+    バックエンド固有のフィルタへの変換は各ベクトルストアが行う。条件が無い場合は None を返す。
+    """
+    filters = filters or SearchFilters()
+    conditions = []
+    if filters.language or language:
+        conditions.append(("language", "equal", filters.language or language))
+    if filters.source:
+        conditions.append(("source", "equal", filters.source))
+    if filters.source_type:
+        conditions.append(("source_type", "equal", filters.source_type))
+    if filters.ingested_after:
+        conditions.append(("ingested_at", "greater_or_equal", filters.ingested_after))
+    if filters.ingested_before:
+        conditions.append(("ingested_at", "less_than", filters.ingested_before))
+
+    return conditions or None
+
+
+def retrieve_documents(
+    store,
+    query_vector: List[float],
+    filters: Optional[SearchFilters],
+    language: Optional[str]
+) -> List[Document]:
+    """
+    メタデータで事前に絞り込んでベクトル検索。
+    自動言語フィルタで結果が0件の場合（言語未記録の既存チャンク等）は言語条件を外して再検索する。
+    絞り込み自体が失敗した場合（メタデータ用プロパティが無いコレクション等）は条件なしで再検索する。
+    """
+    conditions = build_search_filter(filters, language)
+    try:
+        docs = store.similarity_search_by_vector(query_vector, k=RETRIEVAL_K, filters=conditions)
+    except ValueError as e:
+        if not conditions:
+            raise
+        print(f"絞り込み検索に失敗したため条件なしで再検索します: {e}")
+        return store.similarity_search_by_vector(query_vector, k=RETRIEVAL_K)
+    if not docs and language and not (filters and filters.language):
+        docs = store.similarity_search_by_vector(
+            query_vector, k=RETRIEVAL_K, filters=build_search_filter(filters, None)
+        )
+    return docs
+
+
+def condense_question(llm, question: str, history: str, language: str) -> str:
+    """フォローアップ質問を会話履歴に依存しない検索用の質問に変換"""
+    if not history:
+        return question
+    prompt = ChatPromptTemplate.from_template(get_condense_template(language))
+    chain = prompt | llm | StrOutputParser()
+    standalone = chain.invoke({"history": history, "question": question}).strip()
+    return standalone or question
+
+
+def get_rag_chain(llm, language: str):
+    """
+    言語に応じたプロンプトでRAGチェーンを構築。
+    入力は {"history", "context", "question"} の辞書。
     /ask エンドポイントから呼び出される。
     """
-    language = detect_language(question)
     template = get_prompt_template(language)
     prompt = ChatPromptTemplate.from_template(template)
 
-    return (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | get_llm()
-        | StrOutputParser()
-    )
+    return prompt | llm | StrOutputParser()
+
+
+def answer_question(backends: Backends, request: QueryRequest) -> dict:
+    """
+    会話セッションを踏まえてRAGで回答を生成。
+    1. 履歴をトークン予算内に整形
+    2. フォローアップ質問を独立した検索クエリに変換
+    3. 前回と同じ話題・同じ検索条件なら前回の検索結果を再利用、
+       そうでなければ質問の言語と指定条件で絞り込んで再検索
+    4. 履歴・文脈・質問からLLMで回答を生成し、セッションに記録
+    """
+    llm = backends.llm_factory()
+    with backends.tenant_registry.use(request.tenant) as store:
+        session_id, session = conversation_store.get_or_create(
+            request.session_id, request.tenant, request.conversation_history
+        )
+        snapshot = conversation_store.snapshot(session)
+        language = detect_language(request.question)
+        history = format_history(snapshot.turns, HISTORY_TOKEN_BUDGET)
+
+        standalone_question = condense_question(llm, request.question, history, language)
+        query_vector = backends.embeddings.embed_query(standalone_question)
+
+        filter_language = language if request.auto_language_filter else None
+        filter_key = f"{filter_language}|{request.filters.model_dump_json() if request.filters else ''}"
+
+        if (
+            snapshot.last_docs
+            and snapshot.last_query_vector is not None
+            and snapshot.last_filter_key == filter_key
+            and cosine_similarity(query_vector, snapshot.last_query_vector) >= TOPIC_REUSE_THRESHOLD
+        ):
+            docs = snapshot.last_docs
+        else:
+            docs = retrieve_documents(store, query_vector, request.filters, filter_language)
+
+        answer = get_rag_chain(llm, language).invoke({
+            "history": history or ("（なし）" if language == 'ja' else "(none)"),
+            "context": format_docs(docs),
+            "question": request.question
+        })
+        conversation_store.record_turn(session, request.question, answer, query_vector, filter_key, docs)
+
+        return {"answer": answer, "session_id": session_id}
+
+
+##########################################
+# アドミッション制御
+##########################################
+
+# 対話系（/ask）レーン：チャットの応答性を優先して多めの同時実行数・短い待ち時間上限とする
+interactive_lane = AdmissionLane(
+    name="interactive",
+    max_concurrency=int(os.getenv("ASK_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("ASK_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))
+)
+
+# 一括登録系（/ingest, /upload/, /ingest-url, スナップショット）レーン：
+# 埋め込み計算でCPUを占有しないよう同時実行数を絞り、長めの待ち時間を許容する
+ingest_lane = AdmissionLane(
+    name="ingest",
+    max_concurrency=int(os.getenv("INGEST_MAX_CONCURRENCY", "1")),
+    max_queue=int(os.getenv("INGEST_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("INGEST_QUEUE_TIMEOUT", "60"))
+)
+
+# 対話系の実行中＋待ち件数がこの値以上の間、一括登録はファイル・バッチの合間で処理を譲る（0で無効）
+INGEST_YIELD_THRESHOLD = int(os.getenv("INGEST_YIELD_THRESHOLD", "1"))
+# 1回あたりに譲る最長秒数（チャットが途切れない場合でも登録が進むようにする）
+INGEST_YIELD_MAX_WAIT = float(os.getenv("INGEST_YIELD_MAX_WAIT", "2"))
+
+
+def yield_to_chat() -> None:
+    """一括登録の区切り毎に呼び出し、チャットが混雑している間はCPUを明け渡す"""
+    if INGEST_YIELD_THRESHOLD > 0:
+        ingest_lane.yield_to(interactive_lane, INGEST_YIELD_THRESHOLD, INGEST_YIELD_MAX_WAIT)
+
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """レーン毎の待ち行列長・実行数・拒否数・待ち時間を返す"""
+    return {lane.name: lane.metrics() for lane in (interactive_lane, ingest_lane)}
 
 
 ##########################################
@@ -443,24 +1101,43 @@ def get_rag_chain(question: str):
 ##########################################
 
 @app.post("/ask")
-async def ask_question(request: QueryRequest):
-    """RAGを使って質問に回答する"""
+async def ask_question(request: QueryRequest, backends: Backends = Depends(get_backends)):
+    """RAGを使って質問に回答する（session_id 指定で会話を継続）"""
     try:
-        rag_chain = get_rag_chain(request.question)
-        response = rag_chain.invoke(request.question)
-        return {"answer": response}
+        return await interactive_lane.run(answer_question, backends, request)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """会話セッションを破棄する"""
+    if not conversation_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="指定されたセッションが見つかりません")
+    return {"status": "success", "message": "セッションを削除しました"}
+
+
 @app.post("/ingest")
-async def ingest_documents(request: IngestRequest):
+async def ingest_documents(request: IngestRequest, backends: Backends = Depends(get_backends)):
     """テキストを直接知識ベースに保存"""
-    try:
-        vector_store.add_texts([request.text])
-        return {"status": "success", "message": "ドキュメントが知識ベースに保存されました"}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    return await ingest_lane.run(save_text, backends, request)
+
+
+def save_text(backends: Backends, request: IngestRequest):
+    """テキスト1件をベクトルストアに保存"""
+    with backends.tenant_registry.use(request.tenant, create=True) as store:
+        check_chunk_quota(store, 1)
+        yield_to_chat()
+        try:
+            store.add_texts(
+                [request.text],
+                metadatas=build_chunk_metadatas([request.text], request.source, "text")
+            )
+            return {"status": "success", "message": "ドキュメントが知識ベースに保存されました"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
 
 
 ##########################################
@@ -481,11 +1158,22 @@ EXTENSION_MAP = {
 }
 
 
+def get_upload_dir(ext: str, tenant: Optional[str]) -> str:
+    """拡張子とテナントに応じた保存先ディレクトリを返す（テナント毎にディレクトリを分離）"""
+    if tenant is None:
+        return EXTENSION_MAP[ext]
+    save_dir = os.path.join(uploaded_files_dir, "tenants", tenant, os.path.basename(EXTENSION_MAP[ext]))
+    os.makedirs(save_dir, exist_ok=True)
+    return save_dir
+
+
 @app.post("/upload/")
 async def upload_file(
     file: UploadFile = File(...),
     chunk_size: int = Form(default=1024),
-    preprocess: bool = Form(default=True)
+    preprocess: bool = Form(default=True),
+    tenant: Optional[str] = Form(default=None),
+    backends: Backends = Depends(get_backends)
 ):
     """
     ファイルをアップロードして知識ベースに保存。
@@ -500,25 +1188,11 @@ async def upload_file(
             detail=f"Unsupported file type: {ext}. Only PDF and TXT are allowed."
         )
 
-    save_dir = EXTENSION_MAP[ext]
-    file_path = os.path.join(save_dir, filename)
-
-    # ファイル保存（上書き）
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # インジェスト処理の実行
-    request_obj = FileIngestRequest(
-        directory_path=save_dir,
-        chunk_size=chunk_size,
-        preprocess=preprocess
+    # 混雑時はテナントの作成やファイルの保存を行う前に拒否される
+    ingest_result = await ingest_lane.run(
+        save_and_ingest_file, backends, file, filename, ext, chunk_size, preprocess, tenant
     )
 
-    if ext == ".pdf":
-        ingest_result = ingest_pdfs_from_directory(request_obj)
-    else:
-        ingest_result = ingest_txts_from_directory(request_obj)
-
     return {
         "message": f"File uploaded successfully, {ingest_result['message']}",
         "filename": filename,
@@ -526,66 +1200,103 @@ async def upload_file(
     }
 
 
-def ingest_pdfs_from_directory(request: FileIngestRequest):
+def save_and_ingest_file(
+    backends: Backends,
+    file: UploadFile,
+    filename: str,
+    ext: str,
+    chunk_size: int,
+    preprocess: bool,
+    tenant: Optional[str]
+):
+    """アップロードファイルを保存してインジェスト処理を実行"""
+    # テナントの検証（ファイル保存前に行う）。投入が終わるまでテナントをHOTに保つ
+    with backends.tenant_registry.use(tenant, create=True):
+        request = FileIngestRequest(
+            directory_path=get_upload_dir(ext, tenant),
+            chunk_size=chunk_size,
+            preprocess=preprocess,
+            tenant=tenant
+        )
+        file_path = os.path.join(request.directory_path, filename)
+
+        # ファイル保存（上書き）
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        if ext == ".pdf":
+            return ingest_pdfs_from_directory(backends, request)
+        return ingest_txts_from_directory(backends, request)
+
+
+def ingest_pdfs_from_directory(backends: Backends, request: FileIngestRequest):
     """PDFディレクトリの内容を処理してベクトルストアに保存"""
-    chunks = process_pdf_directory(
+    chunks, metadatas = process_pdf_directory(
         request.directory_path,
         request.chunk_size,
         request.preprocess
     )
-
-    batch_size = min(50, max(10, len(chunks) // 10))
-    successful_chunks = 0
-
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i + batch_size]
-        try:
-            vector_store.add_texts(batch)
-            successful_chunks += len(batch)
-        except Exception as e:
-            print(f"バッチ {i // batch_size + 1} の保存中にエラーが発生しました: {e}")
-            # 個別リトライ
-            for chunk in batch:
-                try:
-                    vector_store.add_texts([chunk])
-                    successful_chunks += 1
-                except Exception as e:
-                    print(f"チャンクの保存に失敗しました: {e}")
-
-    return {
-        "status": "success" if successful_chunks > 0 else "partial",
-        "message": f"{successful_chunks}/{len(chunks)}個のチャンクを保存しました",
-        "details": {
-            "chunk_size": request.chunk_size,
-            "preprocessing": request.preprocess,
-            "source_directory": request.directory_path
+    with backends.tenant_registry.use(request.tenant, create=True) as store:
+        check_chunk_quota(store, len(chunks))
+
+        batch_size = min(50, max(10, len(chunks) // 10))
+        successful_chunks = 0
+
+        for i in range(0, len(chunks), batch_size):
+            batch = chunks[i:i + batch_size]
+            batch_metadatas = metadatas[i:i + batch_size]
+            yield_to_chat()
+            try:
+                store.add_texts(batch, metadatas=batch_metadatas)
+                successful_chunks += len(batch)
+            except Exception as e:
+                print(f"バッチ {i // batch_size + 1} の保存中にエラーが発生しました: {e}")
+                # 個別リトライ
+                for chunk, metadata in zip(batch, batch_metadatas):
+                    try:
+                        store.add_texts([chunk], metadatas=[metadata])
+                        successful_chunks += 1
+                    except Exception as e:
+                        print(f"チャンクの保存に失敗しました: {e}")
+
+        return {
+            "status": "success" if successful_chunks > 0 else "partial",
+            "message": f"{successful_chunks}/{len(chunks)}個のチャンクを保存しました",
+            "details": {
+                "chunk_size": request.chunk_size,
+                "preprocessing": request.preprocess,
+                "source_directory": request.directory_path,
+                "tenant": request.tenant
+            }
         }
-    }
 
 
-def ingest_txts_from_directory(request: FileIngestRequest):
+def ingest_txts_from_directory(backends: Backends, request: FileIngestRequest):
     """TXTディレクトリの内容を処理してベクトルストアに保存"""
-    chunks = process_txt_directory(
+    chunks, metadatas = process_txt_directory(
         request.directory_path,
         request.chunk_size,
         request.preprocess
     )
-
-    batch_size = 50
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i + batch_size]
-        vector_store.add_texts(batch)
-
-    print(f"保存成功: {len(chunks)} チャンク")
-    return {
-        "status": "success",
-        "message": f"{len(chunks)}個のチャンクを保存しました",
-        "details": {
-            "chunk_size": request.chunk_size,
-            "preprocessing": request.preprocess,
-            "source_directory": request.directory_path
+    with backends.tenant_registry.use(request.tenant, create=True) as store:
+        check_chunk_quota(store, len(chunks))
+
+        batch_size = 50
+        for i in range(0, len(chunks), batch_size):
+            yield_to_chat()
+            store.add_texts(chunks[i:i + batch_size], metadatas=metadatas[i:i + batch_size])
+
+        print(f"保存成功: {len(chunks)} チャンク")
+        return {
+            "status": "success",
+            "message": f"{len(chunks)}個のチャンクを保存しました",
+            "details": {
+                "chunk_size": request.chunk_size,
+                "preprocessing": request.preprocess,
+                "source_directory": request.directory_path,
+                "tenant": request.tenant
+            }
         }
-    }
 
 
 ####################################
@@ -643,7 +1354,7 @@ def process_url_content(content: str, chunk_size: int, preprocess: bool) -> List
 ##########################################
 
 @app.post("/ingest-url")
-async def ingest_from_url(request: UrlIngestRequest):
+async def ingest_from_url(request: UrlIngestRequest, backends: Backends = Depends(get_backends)):
     """
     URLの内容を知識ベースに保存。
     HTMLページの場合は主要コンテンツを抽出して保存。
@@ -651,53 +1362,160 @@ async def ingest_from_url(request: UrlIngestRequest):
     if not is_valid_url(request.url):
         raise HTTPException(status_code=400, detail="無効なURL形式です")
 
+    return await ingest_lane.run(ingest_url_content, backends, request)
+
+
+def ingest_url_content(backends: Backends, request: UrlIngestRequest):
+    """URLのコンテンツを取得・チャンク分割してベクトルストアに保存"""
     content = fetch_url_content(request.url)
     if not content:
         raise HTTPException(status_code=400, detail="URLからコンテンツを取得できませんでした")
 
+    yield_to_chat()
     chunks = process_url_content(content, request.chunk_size, request.preprocess)
     if not chunks:
         raise HTTPException(status_code=400, detail="有効なチャンクを生成できませんでした")
+    metadatas = build_chunk_metadatas(chunks, request.url, "url")
+
+    with backends.tenant_registry.use(request.tenant, create=True) as store:
+        check_chunk_quota(store, len(chunks))
+
+        batch_size = min(50, max(10, len(chunks) // 10))
+        successful_chunks = 0
+
+        for i in range(0, len(chunks), batch_size):
+            batch = chunks[i:i + batch_size]
+            batch_metadatas = metadatas[i:i + batch_size]
+            yield_to_chat()
+            try:
+                print(f"バッチ {i // batch_size + 1} を保存中: {len(batch)} チャンク")
+                store.add_texts(batch, metadatas=batch_metadatas)
+                successful_chunks += len(batch)
+            except Exception as e:
+                print(f"バッチ {i // batch_size + 1} の保存中にエラーが発生しました: {e}")
+                for chunk, metadata in zip(batch, batch_metadatas):
+                    try:
+                        store.add_texts([chunk], metadatas=[metadata])
+                        successful_chunks += 1
+                    except Exception as e:
+                        print(f"チャンクの保存に失敗しました: {e}")
+
+        return {
+            "status": "success" if successful_chunks > 0 else "partial",
+            "message": f"{successful_chunks}/{len(chunks)}個のチャンクを保存しました",
+            "details": {
+                "url": request.url,
+                "tenant": request.tenant,
+                "chunk_size": request.chunk_size,
+                "preprocessing": request.preprocess,
+                "content_length": len(content)
+            }
+        }
 
-    batch_size = min(50, max(10, len(chunks) // 10))
-    successful_chunks = 0
 
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i + batch_size]
-        try:
-            print(f"バッチ {i // batch_size + 1} を保存中: {len(batch)} チャンク")
-            vector_store.add_texts(batch)
-            successful_chunks += len(batch)
-        except Exception as e:
-            print(f"バッチ {i // batch_size + 1} の保存中にエラーが発生しました: {e}")
-            for chunk in batch:
-                try:
-                    vector_store.add_texts([chunk])
-                    successful_chunks += 1
-                except Exception as e:
-                    print(f"チャンクの保存に失敗しました: {e}")
+##########################################
+# スナップショット エンドポイント
+##########################################
+
+# スナップショットファイルの保存先ディレクトリ
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+
+def get_snapshot_path(name: str) -> str:
+    """スナップショット名から保存先パスを返す（ディレクトリ外の参照を防ぐ）"""
+    filename = os.path.basename(name)
+    if not filename:
+        raise HTTPException(status_code=400, detail="無効なスナップショット名です")
+    if not filename.endswith(".parquet"):
+        filename += ".parquet"
+    return os.path.join(SNAPSHOT_DIR, filename)
+
+
+@app.post("/snapshot/export")
+async def export_snapshot(request: SnapshotRequest, backends: Backends = Depends(get_backends)):
+    """
+    知識ベース（テキスト・メタデータ・ベクトル）を Parquet 形式のスナップショットに出力。
+    tenant 指定時はそのテナントのみ、未指定時は共有インデックスを出力する。
+    """
+    if backends.client is None:
+        raise HTTPException(status_code=400, detail="インメモリバックエンドではスナップショットに対応していません")
+    path = get_snapshot_path(request.name)
+    try:
+        result = await ingest_lane.run(export_tenant_snapshot, backends, path, request.tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", "message": f"{result['rows']}件をエクスポートしました", "details": result}
+
+
+@app.post("/snapshot/import")
+async def import_snapshot_endpoint(request: SnapshotRequest, backends: Backends = Depends(get_backends)):
+    """
+    スナップショットを知識ベースに一括投入（埋め込み計算なし）。
+    tenant 指定時はそのテナントに、未指定時は共有インデックスに投入する。
+    """
+    if backends.client is None:
+        raise HTTPException(status_code=400, detail="インメモリバックエンドではスナップショットに対応していません")
+    path = get_snapshot_path(request.name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="指定されたスナップショットが見つかりません")
+
+    try:
+        result = await ingest_lane.run(import_tenant_snapshot, backends, path, request.tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {
-        "status": "success" if successful_chunks > 0 else "partial",
-        "message": f"{successful_chunks}/{len(chunks)}個のチャンクを保存しました",
-        "details": {
-            "url": request.url,
-            "chunk_size": request.chunk_size,
-            "preprocessing": request.preprocess,
-            "content_length": len(content)
-        }
+        "status": "success" if result["failed"] == 0 else "partial",
+        "message": f"{result['rows']}件をインポートしました",
+        "details": result
     }
 
 
+def export_tenant_snapshot(backends: Backends, path: str, tenant: Optional[str]) -> dict:
+    """テナント（未指定時は共有インデックス）をスナップショットに出力"""
+    collection_name = WEAVIATE_TENANT_INDEX_NAME if tenant else WEAVIATE_INDEX_NAME
+    # 出力が終わるまでテナントをHOTに保つ
+    with backends.tenant_registry.use(tenant):
+        return export_collection(backends.client, collection_name, path, tenant)
+
+
+def import_tenant_snapshot(backends: Backends, path: str, tenant: Optional[str]) -> dict:
+    """スナップショットをテナント（未指定時は共有インデックス）に投入"""
+    collection_name = WEAVIATE_TENANT_INDEX_NAME if tenant else WEAVIATE_INDEX_NAME
+    try:
+        # 投入が終わるまでテナントをHOTに保つ
+        with backends.tenant_registry.use(tenant, create=True) as store:
+            if tenant:
+                check_chunk_quota(store, read_snapshot_info(path)["rows"])
+            # 現在の埋め込みモデルと次元数が異なるスナップショットは拒否される
+            expected_dim = len(backends.embeddings.embed_query("dimension"))
+            return import_snapshot(backends.client, path, collection_name, tenant, expected_dim=expected_dim)
+    finally:
+        # 投入後のチャンク数を次回アクセス時に再取得させる
+        if tenant:
+            backends.tenant_registry.forget(tenant)
+
+
 ##########################################
-# シャットダウン処理
+# 起動・シャットダウン処理
 ##########################################
 
+@app.on_event("startup")
+async def startup_event():
+    """起動時にバックエンド（埋め込みモデル・Weaviate接続・スキーマ）を初期化する"""
+    if get_backends not in app.dependency_overrides:
+        get_backends()
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """アプリケーション終了時にWeaviateクライアントを閉じる"""
-    client.close()
-    print("Weaviateクライアントを閉じました")
+    """アプリケーション終了時にレーンのスレッドプールとWeaviateクライアントを閉じる"""
+    interactive_lane.shutdown()
+    ingest_lane.shutdown()
+    if get_backends.cache_info().currsize and get_backends().client is not None:
+        get_backends().client.close()
+        print("Weaviateクライアントを閉じました")
 
 
 ##########################################
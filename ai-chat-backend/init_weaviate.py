@@ -1,72 +1,88 @@
 # file: ai-chat-backend/init_weaviate.py
 import os
+import re
 from dotenv import load_dotenv
 load_dotenv()
-import weaviate
-from weaviate.classes.config import Property, DataType  # Import DataType enum
-from weaviate.embedded import EmbeddedOptions
-
-weaviate_url = os.getenv("WEAVIATE_URL", "http://localhost:8080")
-
-# Parse URL
-if weaviate_url.startswith("http://"):
-    http_host = weaviate_url[7:]
-    http_secure = False
-elif weaviate_url.startswith("https://"):
-    http_host = weaviate_url[8:]
-    http_secure = True
-else:
-    http_host = weaviate_url
-    http_secure = False
-
-# Split host and port
-if ":" in http_host:
-    http_host, http_port = http_host.split(":")
-    http_port = int(http_port)
-else:
-    http_port = 80 if not http_secure else 443
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+from weaviate_setup import connect_weaviate, ensure_collection
 
 # Weaviateクライアントの初期化
-try:
-    client = weaviate.connect_to_local(
-        host=http_host,
-        port=http_port,
-        grpc_port=50051
-    )
-    print("既存のWeaviateインスタンスに接続しました")
-except Exception as e:
-    print(f"既存インスタンスへの接続に失敗しました: {e}")
-    try:
-        client = weaviate.WeaviateClient(
-            embedded_options=EmbeddedOptions(
-                hostname="localhost",
-                port=8090,
-                grpc_port=50052,
-                persistence_data_path="./weaviate_data"
-            )
-        )
-        print("Weaviateを組み込みモードで起動しました（ポート8090）")
-    except Exception as e:
-        print(f"組み込みモードの初期化にも失敗しました: {e}")
-        raise RuntimeError("Weaviateの初期化に完全に失敗しました")
+client = connect_weaviate()
 
 index_name = os.getenv("WEAVIATE_INDEX_NAME", "DefaultCollection")  # Provide default name
 
 # Get the collections object
 collections = client.collections
 
+# メタデータ導入前に登録されたチャンクに設定する値
+LEGACY_SOURCE = "legacy"
+
+
+def detect_language(text: str) -> str:
+    """app.detect_language と同じ判定（日本語文字を含めば 'ja'、それ以外は 'en'）"""
+    if re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text):
+        return 'ja'
+    return 'en'
+
+
+def backfill_metadata(collection) -> int:
+    """
+    メタデータ未設定の既存チャンクに language / source / source_type を設定する。
+    未設定のチャンクは言語フィルタ付きの検索に一致しなくなるため、プロパティ追加後に実行する。
+    """
+    updated = 0
+    for obj in collection.iterator(return_properties=["text", "language", "source", "source_type"]):
+        props = obj.properties
+        missing = {}
+        if not props.get("language"):
+            missing["language"] = detect_language(props.get("text") or "")
+        if not props.get("source"):
+            missing["source"] = LEGACY_SOURCE
+        if not props.get("source_type"):
+            missing["source_type"] = LEGACY_SOURCE
+        if missing:
+            collection.data.update(uuid=obj.uuid, properties=missing)
+            updated += 1
+    return updated
+
+
+def backfill_collection(name: str) -> None:
+    """コレクション（マルチテナントの場合は全テナント）のメタデータを補完"""
+    collection = collections.get(name)
+    if not collection.config.get().multi_tenancy_config.enabled:
+        updated = backfill_metadata(collection)
+        if updated:
+            print(f"{name} の {updated} 件にメタデータを設定しました")
+        return
+
+    for tenant in collection.tenants.get().values():
+        # オフロード中のテナントは一時的にHOTにして処理し、元の状態に戻す
+        cold = tenant.activity_status.value not in ("HOT", "ACTIVE")
+        if cold:
+            collection.tenants.update([Tenant(name=tenant.name, activity_status=TenantActivityStatus.HOT)])
+        try:
+            updated = backfill_metadata(collection.with_tenant(tenant.name))
+        finally:
+            if cold:
+                collection.tenants.update([Tenant(name=tenant.name, activity_status=tenant.activity_status)])
+        if updated:
+            print(f"{name} のテナント {tenant.name} の {updated} 件にメタデータを設定しました")
+
+
 # スキーマ存在確認 & 作成
-if not collections.exists(index_name):
-    # Create the collection
-    collections.create(
-        name=index_name,
-        properties=[
-            Property(name="text", data_type=DataType.TEXT)
-        ],
-        vectorizer_config=None
-    )
+if ensure_collection(client, index_name):
     print("索引创建成功")
 else:
     print("索引已存在")
+    backfill_collection(index_name)
+
+# テナント別データ用のマルチテナントコレクション
+tenant_index_name = os.getenv("WEAVIATE_TENANT_INDEX_NAME", f"{index_name}Tenants")
+
+if ensure_collection(client, tenant_index_name, multi_tenancy=True):
+    print("マルチテナント用コレクションを作成しました")
+else:
+    print("マルチテナント用コレクションは既に存在します")
+    backfill_collection(tenant_index_name)
 
 client.close()  # コネクションを明示的にクローズ
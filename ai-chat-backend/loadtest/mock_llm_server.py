@@ -0,0 +1,156 @@
+"""
+負荷試験用 OpenAI / Groq 互換モックサーバー
+実際のLLMを呼ばずに、設定した遅延（初回トークンまでの時間・トークン生成速度）で
+決定的な回答を返す。/ingest-url 用の疑似Webページも配信する
+
+使い方:
+    python loadtest/mock_llm_server.py --port 9000 --ttft-ms 300 --tokens-per-second 200
+
+バックエンド側の設定例:
+    LLM_PROVIDER=openai OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=mock
+    LLM_PROVIDER=groq GROQ_BASE_URL=http://localhost:9000 GROQ_API_KEY=mock
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import time
+from typing import List, Optional
+
+# サードパーティライブラリ
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+app = FastAPI()
+
+# 起動時引数で上書きされる応答特性
+config = {
+    "ttft_ms": 300.0,
+    "tokens_per_second": 200.0,
+    "output_tokens": 100,
+}
+
+# 回答生成に使う単語（質問のハッシュで選択するため同じ質問には同じ回答を返す）
+WORDS = [
+    "LangChain", "Weaviate", "RAG", "ベクトル", "検索", "文脈", "回答", "framework",
+    "retrieval", "embedding", "document", "knowledge", "社内", "手順", "申請", "設定",
+]
+
+
+class ChatCompletionMessage(BaseModel):
+    role: str
+    content: Optional[str] = ""
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str = "mock"
+    messages: List[ChatCompletionMessage]
+    stream: bool = False
+    max_tokens: Optional[int] = None
+
+
+def generate_tokens(prompt: str, count: int) -> List[str]:
+    """プロンプトのハッシュから決定的なトークン列を生成"""
+    seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+    return [WORDS[seed[i % len(seed)] % len(WORDS)] + " " for i in range(count)]
+
+
+def estimate_tokens(text: str) -> int:
+    """プロンプトトークン数の概算（4文字≒1トークン）"""
+    return math.ceil(len(text) / 4)
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    """OpenAI Chat Completions 互換エンドポイント（Groq のパスにも対応）"""
+    prompt = "\n".join(message.content or "" for message in request.messages)
+    count = min(request.max_tokens or config["output_tokens"], config["output_tokens"])
+    tokens = generate_tokens(prompt, count)
+    token_interval = 1 / config["tokens_per_second"]
+    completion_id = f"chatcmpl-{hashlib.md5(prompt.encode('utf-8')).hexdigest()[:12]}"
+    created = int(time.time())
+    usage = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "completion_tokens": count,
+        "total_tokens": estimate_tokens(prompt) + count,
+    }
+
+    if request.stream:
+        async def event_stream():
+            await asyncio.sleep(config["ttft_ms"] / 1000)
+            for token in tokens:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": request.model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(token_interval)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(config["ttft_ms"] / 1000 + count * token_interval)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": request.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(tokens).strip()},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+@app.get("/pages/{page_id}", response_class=HTMLResponse)
+async def page(page_id: int, paragraphs: int = 20):
+    """/ingest-url の取得先となる決定的な疑似Webページ"""
+    body = "\n".join(
+        f"<p>{''.join(generate_tokens(f'page-{page_id}-{i}', 40))}</p>"
+        for i in range(paragraphs)
+    )
+    return f"<html><body><main><h1>Page {page_id}</h1>{body}</main></body></html>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="負荷試験用 OpenAI / Groq 互換モックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft-ms", type=float, default=config["ttft_ms"], help="初回トークンまでの遅延（ミリ秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=config["tokens_per_second"], help="トークン生成速度")
+    parser.add_argument("--output-tokens", type=int, default=config["output_tokens"], help="回答のトークン数")
+    args = parser.parse_args()
+
+    config.update(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
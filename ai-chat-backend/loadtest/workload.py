@@ -0,0 +1,316 @@
+"""
+負荷試験用ワークロード生成ツール
+/ask・/upload/・/ingest-url を種類毎のワーカー数で同時に送信し、
+エンドポイント別のスループットとレイテンシ（p50/p90/p99）を集計する。
+送信内容は --seed から決定的に生成されるため、同じ条件で繰り返し比較できる
+
+使い方（チャットのみ → 大量登録と並行、の2回を実行して /ask の p99 を比較する例）:
+    python loadtest/workload.py --duration 60 --ask-workers 8
+    python loadtest/workload.py --duration 60 --ask-workers 8 --upload-workers 2 --url-workers 2
+
+--compare を指定すると上記2回を続けて実行し、/ask の p99 の悪化率が
+--max-p99-ratio を超えた場合は終了コード1を返す:
+    python loadtest/workload.py --compare --duration 60 --ask-workers 8 --upload-workers 2 --url-workers 2
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# サードパーティライブラリ
+import requests
+
+
+# 質問文（日本語・英語を混在させて言語フィルタ経路も通す）
+QUESTIONS = [
+    "LangChainとは何ですか？",
+    "経費精算の提出期限はいつですか？",
+    "VPNに接続できない場合はどうすればよいですか？",
+    "有給休暇の申請方法を教えてください。",
+    "What is Weaviate used for?",
+    "How do I set up a new PC?",
+]
+
+# 直前の回答を受けたフォローアップ質問（会話セッション経路を通す）
+FOLLOW_UPS = [
+    "もう少し詳しく教えてください。",
+    "2番目の点について説明してください。",
+    "Can you give an example?",
+]
+
+# アップロードするテキストの生成に使う文
+SENTENCES = [
+    "社内ネットワークへ接続するにはVPNクライアントを使用します。",
+    "経費精算の提出期限は毎月25日です。",
+    "有給休暇は人事システムから申請できます。",
+    "Weaviate is a vector database used for similarity search.",
+    "LangChain is a framework for building LLM applications.",
+    "新規PCを受け取ったら初期設定を行います。",
+]
+
+
+class Recorder:
+    """エンドポイント別にレイテンシとステータスを記録（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, status: str, latency: float) -> None:
+        with self._lock:
+            self.statuses[endpoint][status] += 1
+            if status == "200":
+                self.latencies[endpoint].append(latency)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """ソート済みリストの p パーセンタイル（最近傍法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(len(sorted_values) * p / 100) - 1))
+    return sorted_values[index]
+
+
+def send(recorder: Recorder, endpoint: str, func) -> Optional[requests.Response]:
+    """1リクエストを送信して結果を記録"""
+    started = time.perf_counter()
+    try:
+        response = func()
+        status = str(response.status_code)
+    except requests.RequestException as e:
+        response = None
+        status = type(e).__name__
+    recorder.record(endpoint, status, time.perf_counter() - started)
+    return response
+
+
+#####################################
+# ワーカー
+#####################################
+
+def prepare(args) -> None:
+    """試験前に各テナント（未指定時は共有インデックス）へ初期ドキュメントを登録"""
+    rng = random.Random(f"{args.seed}-prepare")
+    tenants = [f"tenant-{i}" for i in range(args.tenants)] or [None]
+    session = requests.Session()
+    for tenant in tenants:
+        for _ in range(args.seed_docs):
+            payload = {"text": " ".join(rng.sample(SENTENCES, 3)), "source": "loadtest"}
+            if tenant:
+                payload["tenant"] = tenant
+            response = session.post(f"{args.base_url}/ingest", json=payload, timeout=args.timeout)
+            response.raise_for_status()
+    print(f"初期ドキュメントを登録しました: {len(tenants)} テナント × {args.seed_docs} 件")
+
+
+def ask_worker(args, worker_id: int, deadline: float, recorder: Recorder) -> None:
+    """
+    質問を送り続ける。3問に1回は新しい会話を開始し、それ以外はフォローアップ質問を送る。
+    会話セッションはテナント毎のため、テナントは会話の開始時に選ぶ
+    """
+    rng = random.Random(f"{args.seed}-ask-{worker_id}")
+    session = requests.Session()
+    session_id = None
+    tenant = None
+    turn = 0
+    while time.monotonic() < deadline:
+        if turn % 3 == 0:
+            session_id = None
+            question = rng.choice(QUESTIONS)
+            if args.tenants:
+                tenant = f"tenant-{rng.randrange(args.tenants)}"
+        else:
+            question = rng.choice(FOLLOW_UPS)
+        payload = {"question": question, "session_id": session_id}
+        if tenant:
+            payload["tenant"] = tenant
+
+        response = send(recorder, "/ask", lambda: session.post(
+            f"{args.base_url}/ask", json=payload, timeout=args.timeout
+        ))
+        if response is not None and response.status_code == 200:
+            session_id = response.json().get("session_id")
+        turn += 1
+
+
+def upload_worker(args, worker_id: int, deadline: float, recorder: Recorder) -> None:
+    """テキストファイルのアップロードを送り続ける（ワーカー毎に同じファイル名で上書き）"""
+    rng = random.Random(f"{args.seed}-upload-{worker_id}")
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        text = ""
+        while len(text) < args.upload_chars:
+            text += rng.choice(SENTENCES)
+        data = {"chunk_size": "1000", "preprocess": "true"}
+        if args.tenants:
+            data["tenant"] = f"tenant-{rng.randrange(args.tenants)}"
+        files = {"file": (f"load-{worker_id}.txt", text.encode("utf-8"), "text/plain")}
+
+        send(recorder, "/upload/", lambda: session.post(
+            f"{args.base_url}/upload/", data=data, files=files, timeout=args.timeout
+        ))
+
+
+def url_worker(args, worker_id: int, deadline: float, recorder: Recorder) -> None:
+    """モックサーバーの疑似ページを /ingest-url で登録し続ける"""
+    rng = random.Random(f"{args.seed}-url-{worker_id}")
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        payload = {"url": f"{args.mock_url}/pages/{rng.randrange(1000)}", "chunk_size": 1000}
+        if args.tenants:
+            payload["tenant"] = f"tenant-{rng.randrange(args.tenants)}"
+
+        send(recorder, "/ingest-url", lambda: session.post(
+            f"{args.base_url}/ingest-url", json=payload, timeout=args.timeout
+        ))
+
+
+#####################################
+# 集計
+#####################################
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    """エンドポイント別のスループットとレイテンシ（ミリ秒）を集計"""
+    summary = {}
+    for endpoint, statuses in sorted(recorder.statuses.items()):
+        latencies = sorted(recorder.latencies[endpoint])
+        summary[endpoint] = {
+            "requests": sum(statuses.values()),
+            "statuses": dict(statuses),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    """集計結果を表形式で表示"""
+    print(f"{'endpoint':<12} {'reqs':>6} {'rps':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  statuses")
+    for endpoint, row in summary.items():
+        print(
+            f"{endpoint:<12} {row['requests']:>6} {row['throughput_rps']:>8} "
+            f"{row['p50_ms']:>9} {row['p90_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}  "
+            f"{json.dumps(row['statuses'])}"
+        )
+
+
+def fetch_admission_metrics(args) -> Optional[dict]:
+    """バックエンドのアドミッション制御メトリクスを取得して表示"""
+    try:
+        admission = requests.get(f"{args.base_url}/metrics/admission", timeout=10).json()
+        print(json.dumps(admission, ensure_ascii=False, indent=2))
+        return admission
+    except requests.RequestException as e:
+        print(f"アドミッション制御のメトリクス取得に失敗しました: {e}")
+        return None
+
+
+def run_phase(args, ask_workers: int, upload_workers: int, url_workers: int) -> dict:
+    """指定したワーカー数で args.duration 秒間送信し、集計結果を返す"""
+    recorder = Recorder()
+    workers = (
+        [(ask_worker, i) for i in range(ask_workers)]
+        + [(upload_worker, i) for i in range(upload_workers)]
+        + [(url_worker, i) for i in range(url_workers)]
+    )
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        futures = [executor.submit(worker, args, worker_id, deadline, recorder) for worker, worker_id in workers]
+        for future in futures:
+            future.result()
+    elapsed = time.monotonic() - started
+
+    summary = summarize(recorder, elapsed)
+    print_summary(summary)
+    return summary
+
+
+def compare_ask_p99(baseline: dict, mixed: dict, max_ratio: float) -> dict:
+    """チャットのみ（baseline）と登録並行時（mixed）の /ask p99 を比較"""
+    baseline_p99 = baseline.get("/ask", {}).get("p99_ms", 0.0)
+    mixed_p99 = mixed.get("/ask", {}).get("p99_ms", 0.0)
+    ratio = round(mixed_p99 / baseline_p99, 2) if baseline_p99 else None
+    return {
+        "baseline_p99_ms": baseline_p99,
+        "mixed_p99_ms": mixed_p99,
+        "ratio": ratio,
+        "max_ratio": max_ratio,
+        "passed": ratio is not None and ratio <= max_ratio
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="負荷試験用ワークロード生成ツール")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="バックエンドのURL")
+    parser.add_argument("--mock-url", default="http://localhost:9000", help="モックサーバーのURL（/ingest-url の取得先）")
+    parser.add_argument("--duration", type=float, default=30, help="試験時間（秒）")
+    parser.add_argument("--ask-workers", type=int, default=4, help="/ask を送るワーカー数")
+    parser.add_argument("--upload-workers", type=int, default=0, help="/upload/ を送るワーカー数")
+    parser.add_argument("--url-workers", type=int, default=0, help="/ingest-url を送るワーカー数")
+    parser.add_argument("--upload-chars", type=int, default=20000, help="アップロード1件あたりの文字数")
+    parser.add_argument("--tenants", type=int, default=0, help="テナント数（0の場合はテナント未指定）")
+    parser.add_argument("--seed-docs", type=int, default=10, help="試験前に登録する初期ドキュメント数（テナント毎）")
+    parser.add_argument("--seed", type=int, default=0, help="送信内容を決める乱数シード")
+    parser.add_argument("--timeout", type=float, default=120, help="リクエストのタイムアウト（秒）")
+    parser.add_argument("--json-output", default=None, help="集計結果を保存するJSONファイル")
+    parser.add_argument("--compare", action="store_true",
+                        help="チャットのみ → 登録並行の2回を実行して /ask の p99 を比較（各回 --duration 秒）")
+    parser.add_argument("--max-p99-ratio", type=float, default=1.5,
+                        help="--compare で許容する /ask p99 の悪化率（登録並行時 ÷ チャットのみ）")
+    args = parser.parse_args()
+    if not (args.ask_workers or args.upload_workers or args.url_workers):
+        parser.error("ワーカー数を1以上指定してください")
+    if args.compare and not (args.ask_workers and (args.upload_workers or args.url_workers)):
+        parser.error("--compare には /ask と登録系の両方のワーカー数が必要です")
+
+    if args.seed_docs:
+        prepare(args)
+
+    if not args.compare:
+        summary = run_phase(args, args.ask_workers, args.upload_workers, args.url_workers)
+        result = {"args": vars(args), "summary": summary, "admission": fetch_admission_metrics(args)}
+    else:
+        print("== チャットのみ ==")
+        baseline = run_phase(args, args.ask_workers, 0, 0)
+        print("== 大量登録と並行 ==")
+        mixed = run_phase(args, args.ask_workers, args.upload_workers, args.url_workers)
+        comparison = compare_ask_p99(baseline, mixed, args.max_p99_ratio)
+        print(
+            f"/ask p99: {comparison['baseline_p99_ms']} ms → {comparison['mixed_p99_ms']} ms "
+            f"（{comparison['ratio']} 倍、許容 {args.max_p99_ratio} 倍）"
+        )
+        result = {
+            "args": vars(args),
+            "baseline": baseline,
+            "mixed": mixed,
+            "comparison": comparison,
+            "admission": fetch_admission_metrics(args)
+        }
+
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare and not result["comparison"]["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
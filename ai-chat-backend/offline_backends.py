@@ -0,0 +1,146 @@
+"""
+オフライン実行用のバックエンド（テスト・負荷試験用）
+Embeddingモデル・Weaviateの代わりに使う疑似埋め込みとインメモリのベクトルストア。
+app.py は EMBEDDING_BACKEND / VECTOR_STORE_BACKEND で指定された場合のみ読み込む
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import math
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+
+# サードパーティライブラリ
+from fastapi import HTTPException
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+# ローカルモジュール
+from tenant_store import TenantVectorStore, validate_tenant_name
+
+
+#####################################
+# 埋め込み
+#####################################
+
+class HashingEmbedding(Embeddings):
+    """
+    文字bigramの出現数をハッシュで各次元に割り当てる疑似埋め込み。
+    DeterministicFakeEmbedding はテキストが少しでも違えば無関係なベクトルになるが、
+    こちらは文字列が似ていればベクトルも近くなるため、話題が同じ場合の検索結果の再利用も発生する。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for i in range(max(1, len(text) - 1)):
+            vector[zlib.crc32(text[i:i + 2].encode("utf-8")) % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def create_embeddings(backend: str, size: int = 384) -> Embeddings:
+    """
+    モデルを使わない疑似埋め込みを生成。
+    fake: テキストのハッシュから決定的なベクトル / hashing: 似た文字列ほど近いベクトル
+    """
+    if backend == "fake":
+        return DeterministicFakeEmbedding(size=size)
+    if backend == "hashing":
+        return HashingEmbedding(size=size)
+    raise ValueError(f"サポートされていないEmbeddingバックエンド: {backend}")
+
+
+#####################################
+# ベクトルストア
+#####################################
+
+def match_condition(metadata: dict, name: str, operator: str, value) -> bool:
+    """メタデータが1つの検索条件（build_search_filter の条件タプル）を満たすか判定"""
+    actual = metadata.get(name)
+    if actual is None:
+        return False
+    if operator == "equal":
+        return actual == value
+    actual = datetime.fromisoformat(actual)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if operator == "greater_or_equal":
+        return actual >= value
+    return actual < value
+
+
+class MemoryVectorStore(InMemoryVectorStore):
+    """
+    Weaviateの代替となるインメモリベクトルストア。
+    build_search_filter が返す検索条件はメタデータの判定関数に変換して検索する。
+    MOCK_VECTOR_STORE_LATENCY_MS で検索・保存毎の疑似遅延を付与できる。
+    """
+
+    latency_seconds = float(os.getenv("MOCK_VECTOR_STORE_LATENCY_MS", "0")) / 1000
+
+    def __init__(self, embedding):
+        super().__init__(embedding=embedding)
+        # 登録レーンと質問レーンから同時に呼ばれるため、内部の辞書操作を排他する
+        self._lock = threading.Lock()
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            return super().add_texts(texts, metadatas=metadatas)
+
+    def similarity_search_by_vector(self, embedding, k=4, filters=None, **kwargs):
+        predicate = None
+        if filters:
+            predicate = lambda doc: all(match_condition(doc.metadata, *condition) for condition in filters)
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            return super().similarity_search_by_vector(embedding, k=k, filter=predicate)
+
+
+class MemoryTenantRegistry:
+    """
+    インメモリバックエンド用のテナント管理。
+    テナント毎に独立した MemoryVectorStore を保持し、オフロードは行わない。
+    """
+
+    def __init__(self, embedding, max_tenants: int, shared_store: Optional[MemoryVectorStore] = None):
+        self.embedding = embedding
+        self.max_tenants = max_tenants
+        self.shared_store = shared_store or MemoryVectorStore(embedding=embedding)
+        self._handles: dict = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(self, tenant: Optional[str], create: bool = False):
+        """テナントのベクトルストアを利用する（TenantRegistry.use と同じ仕様）"""
+        if tenant is None:
+            yield self.shared_store
+            return
+        validate_tenant_name(tenant)
+
+        with self._lock:
+            handle = self._handles.get(tenant)
+            if handle is None:
+                if not create:
+                    raise HTTPException(status_code=404, detail="指定されたテナントが見つかりません")
+                if len(self._handles) >= self.max_tenants:
+                    raise HTTPException(status_code=403, detail="テナント数の上限に達しています")
+                handle = TenantVectorStore(MemoryVectorStore(embedding=self.embedding), tenant, 0)
+                self._handles[tenant] = handle
+        yield handle
+
+    def forget(self, tenant: str) -> None:
+        """チャンク数は常に正確なため何もしない"""
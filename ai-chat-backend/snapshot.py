@@ -0,0 +1,348 @@
+"""
+ナレッジベースのスナップショット エクスポート／インポート
+Weaviateコレクションのテキスト・メタデータ・ベクトルを Parquet 形式で保存し、
+再埋め込みなしで一括復元する（障害復旧・環境複製用）
+
+使い方:
+    python snapshot.py export --output ./snapshots/kb.parquet
+    python snapshot.py import --input ./snapshots/kb.parquet
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import argparse
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# サードパーティライブラリ
+import pyarrow as pa
+import pyarrow.parquet as pq
+import weaviate
+from dotenv import load_dotenv
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+
+# ローカルモジュール
+from weaviate_setup import connect_weaviate
+
+
+# スナップショット形式のバージョン（スキーマ変更時に更新）
+SNAPSHOT_FORMAT_VERSION = "1"
+
+# ベクトル以外に保存するプロパティ
+METADATA_PROPERTIES = ["language", "source", "source_type"]
+
+# 1回に読み書きする行数（メモリ使用量はこの行数分に抑えられる）
+DEFAULT_BATCH_SIZE = 1000
+
+
+def build_schema(dim: int) -> pa.Schema:
+    """スナップショットのスキーマ。ベクトルは float32 の固定長リストで保存"""
+    return pa.schema([
+        ("uuid", pa.string()),
+        ("tenant", pa.string()),
+        ("text", pa.string()),
+        ("language", pa.string()),
+        ("source", pa.string()),
+        ("source_type", pa.string()),
+        ("ingested_at", pa.timestamp("us", tz="UTC")),
+        ("vector", pa.list_(pa.float32(), dim)),
+    ])
+
+
+def _get_vector(obj) -> List[float]:
+    """クライアントのバージョン差異（list / 名前付きベクトルのdict）を吸収してベクトルを取得"""
+    vector = obj.vector
+    if isinstance(vector, dict):
+        vector = vector.get("default") or next(iter(vector.values()), None)
+    return vector
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    """ingested_at を datetime に変換（文字列で保存されている場合も対応）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _is_active(tenant: Tenant) -> bool:
+    """テナントがHOTか（クライアントのバージョンにより HOT は ACTIVE として返される）"""
+    return tenant.activity_status.value in ("HOT", "ACTIVE")
+
+
+def _activate_tenant(collection, tenant: Tenant, previous: Dict[str, TenantActivityStatus]) -> None:
+    """オフロード中のテナントを読み書きのために一時的にHOTにし、元の状態を previous に記録"""
+    if _is_active(tenant) or tenant.name in previous:
+        return
+    collection.tenants.update([Tenant(name=tenant.name, activity_status=TenantActivityStatus.HOT)])
+    previous[tenant.name] = tenant.activity_status
+
+
+def _restore_tenants(collection, previous: Dict[str, TenantActivityStatus]) -> None:
+    """_activate_tenant でHOTにしたテナントを元の状態に戻す"""
+    for name, status in previous.items():
+        try:
+            collection.tenants.update([Tenant(name=name, activity_status=status)])
+        except Exception as e:
+            print(f"テナント {name} の状態を戻せませんでした: {e}")
+
+
+#####################################
+# エクスポート
+#####################################
+
+def export_collection(
+    client: weaviate.WeaviateClient,
+    collection_name: str,
+    output_path: str,
+    tenant: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> dict:
+    """
+    コレクションを Parquet ファイルにストリーミング出力。
+    batch_size 行ごとに1つの行グループとして書き出すため、コレクションの大きさに関わらず
+    メモリ使用量は一定に保たれる。
+    マルチテナントのコレクションで tenant 未指定の場合は全テナントを出力する。
+    COLD のテナントは読み出しの間だけHOTにし、終了後に元の状態へ戻す。
+    一時ファイルに書き出してから置き換えるため、失敗時に既存のスナップショットを壊さない。
+    """
+    collection = client.collections.get(collection_name)
+    if tenant:
+        existing = collection.tenants.get_by_name(tenant)
+        if existing is None:
+            raise ValueError(f"テナント {tenant} が存在しません")
+        tenants = [existing]
+    elif collection.config.get().multi_tenancy_config.enabled:
+        tenants = list(collection.tenants.get().values())
+    else:
+        tenants = [None]
+    previous_status: Dict[str, TenantActivityStatus] = {}
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temp_path = output_path + ".tmp"
+    writer = None
+    columns: Dict[str, list] = {}
+    total_rows = 0
+
+    def flush():
+        nonlocal writer, total_rows
+        if not columns.get("uuid"):
+            return
+        if writer is None:
+            dim = len(columns["vector"][0])
+            schema = build_schema(dim).with_metadata({
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "collection": collection_name,
+                "dim": str(dim),
+                "exported_at": datetime.now(timezone.utc).isoformat()
+            })
+            writer = pq.ParquetWriter(temp_path, schema, compression="zstd")
+        writer.write_table(pa.Table.from_pydict(columns, schema=writer.schema))
+        total_rows += len(columns["uuid"])
+        columns.clear()
+
+    try:
+        for tenant_obj in tenants:
+            tenant_name = tenant_obj.name if tenant_obj else None
+            if tenant_obj:
+                _activate_tenant(collection, tenant_obj, previous_status)
+            source = collection.with_tenant(tenant_name) if tenant_name else collection
+            for obj in source.iterator(include_vector=True):
+                vector = _get_vector(obj)
+                if not vector:
+                    continue
+                props = obj.properties
+                columns.setdefault("uuid", []).append(str(obj.uuid))
+                columns.setdefault("tenant", []).append(tenant_name)
+                columns.setdefault("text", []).append(props.get("text"))
+                for name in METADATA_PROPERTIES:
+                    columns.setdefault(name, []).append(props.get(name))
+                columns.setdefault("ingested_at", []).append(_parse_datetime(props.get("ingested_at")))
+                columns.setdefault("vector", []).append(vector)
+                if len(columns["uuid"]) >= batch_size:
+                    flush()
+        flush()
+        if writer is None:
+            raise ValueError(f"コレクション {collection_name} にエクスポート可能なデータがありません")
+        writer.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        _restore_tenants(collection, previous_status)
+
+    print(f"{total_rows} 件を {output_path} にエクスポートしました")
+    return {"collection": collection_name, "rows": total_rows, "path": output_path}
+
+
+#####################################
+# インポート
+#####################################
+
+def read_snapshot_info(input_path: str) -> dict:
+    """スナップショットのメタ情報（作成元コレクション・次元数・行数）を返す"""
+    parquet_file = pq.ParquetFile(input_path)
+    metadata = {
+        key.decode(): value.decode()
+        for key, value in (parquet_file.schema_arrow.metadata or {}).items()
+    }
+    metadata["rows"] = parquet_file.metadata.num_rows
+    return metadata
+
+
+def iter_snapshot(
+    input_path: str,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[Tuple[List[str], List[str], List[dict], List[List[float]], List[Optional[str]]]]:
+    """
+    スナップショットを batch_size 行ずつ読み出す。
+    (uuids, texts, metadatas, vectors, tenants) を返すため、
+    Weaviate以外のベクトルストアへの投入にもそのまま利用できる。
+    """
+    parquet_file = pq.ParquetFile(input_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        data = batch.to_pydict()
+        metadatas = []
+        for i in range(batch.num_rows):
+            metadata = {name: data[name][i] for name in METADATA_PROPERTIES + ["ingested_at"]}
+            metadatas.append({key: value for key, value in metadata.items() if value is not None})
+        yield data["uuid"], data["text"], metadatas, data["vector"], data["tenant"]
+
+
+def _sample_dim(collection, tenants: Dict[str, Tenant], multi_tenant: bool) -> Optional[int]:
+    """投入先の既存オブジェクトからベクトルの次元数を取得（HOTのテナントのみ参照、空の場合は None）"""
+    if multi_tenant:
+        sources = [collection.with_tenant(name) for name, tenant in tenants.items() if _is_active(tenant)]
+    else:
+        sources = [collection]
+    for source in sources:
+        result = source.query.fetch_objects(limit=1, include_vector=True)
+        if result.objects:
+            vector = _get_vector(result.objects[0])
+            if vector:
+                return len(vector)
+    return None
+
+
+def import_snapshot(
+    client: weaviate.WeaviateClient,
+    input_path: str,
+    collection_name: Optional[str] = None,
+    tenant: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    expected_dim: Optional[int] = None
+) -> dict:
+    """
+    スナップショットを Weaviate に一括投入（埋め込み計算なし）。
+    collection_name 未指定時はエクスポート元のコレクション名を使用する。
+    tenant を指定すると全行をそのテナントに投入し、未指定時はスナップショットに記録されたテナントを使う。
+    同じUUIDのオブジェクトは上書きされるため、再実行しても重複しない。
+    COLD のテナントへは投入の間だけHOTにし、終了後に元の状態へ戻す。
+    ベクトルの次元数が expected_dim（未指定時は投入先の既存オブジェクト）と異なる場合は投入しない。
+    """
+    info = read_snapshot_info(input_path)
+    collection_name = collection_name or info.get("collection")
+    if not collection_name or not client.collections.exists(collection_name):
+        raise ValueError(
+            f"コレクション {collection_name} が存在しません。先に init_weaviate.py を実行してください"
+        )
+
+    collection = client.collections.get(collection_name)
+    multi_tenant = collection.config.get().multi_tenancy_config.enabled
+    known_tenants = collection.tenants.get() if multi_tenant else {}
+
+    # 別の埋め込みモデルで作成されたスナップショットは検索を壊すため拒否する
+    if expected_dim is None:
+        expected_dim = _sample_dim(collection, known_tenants, multi_tenant)
+    if expected_dim is not None and int(info.get("dim", 0)) != expected_dim:
+        raise ValueError(
+            f"スナップショットのベクトル次元数（{info.get('dim')}）が投入先（{expected_dim}）と一致しません"
+        )
+    ready_tenants = set()
+    previous_status: Dict[str, TenantActivityStatus] = {}
+
+    imported_rows = 0
+    try:
+        with client.batch.fixed_size(batch_size=batch_size) as batch:
+            for uuids, texts, metadatas, vectors, tenants in iter_snapshot(input_path, batch_size):
+                for uuid, text, metadata, vector, row_tenant in zip(uuids, texts, metadatas, vectors, tenants):
+                    target_tenant = (tenant or row_tenant) if multi_tenant else None
+                    if multi_tenant and not target_tenant:
+                        raise ValueError("マルチテナントのコレクションへの投入にはテナントの指定が必要です")
+                    if target_tenant and target_tenant not in ready_tenants:
+                        if target_tenant in known_tenants:
+                            _activate_tenant(collection, known_tenants[target_tenant], previous_status)
+                        else:
+                            collection.tenants.create([Tenant(name=target_tenant)])
+                        ready_tenants.add(target_tenant)
+                    batch.add_object(
+                        collection=collection_name,
+                        properties={"text": text, **metadata},
+                        uuid=uuid,
+                        vector=vector,
+                        tenant=target_tenant
+                    )
+                imported_rows += len(uuids)
+                print(f"{imported_rows}/{info['rows']} 件を投入しました")
+    finally:
+        # バッチの送信完了後に元の状態へ戻す
+        _restore_tenants(collection, previous_status)
+
+    failed = client.batch.failed_objects
+    if failed:
+        print(f"{len(failed)} 件の投入に失敗しました（例: {failed[0].message}）")
+
+    return {
+        "collection": collection_name,
+        "rows": imported_rows - len(failed),
+        "failed": len(failed),
+        "path": input_path
+    }
+
+
+#####################################
+# CLI
+#####################################
+
+def main():
+    load_dotenv()
+    default_collection = os.getenv("WEAVIATE_INDEX_NAME", "DefaultIndex")
+
+    parser = argparse.ArgumentParser(description="ナレッジベースのスナップショット エクスポート／インポート")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="コレクションを Parquet ファイルに出力")
+    export_parser.add_argument("--output", required=True, help="出力先ファイルパス")
+    export_parser.add_argument("--collection", default=default_collection, help="対象コレクション名")
+    export_parser.add_argument("--tenant", default=None, help="対象テナント（省略時は全テナント）")
+    export_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    import_parser = subparsers.add_parser("import", help="Parquet ファイルをコレクションに投入")
+    import_parser.add_argument("--input", required=True, help="スナップショットファイルパス")
+    import_parser.add_argument("--collection", default=None, help="投入先コレクション名（省略時はエクスポート元）")
+    import_parser.add_argument("--tenant", default=None, help="投入先テナント（省略時はスナップショットの値）")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args()
+    client = connect_weaviate(embedded_fallback=False)
+    try:
+        if args.command == "export":
+            export_collection(client, args.collection, args.output, args.tenant, args.batch_size)
+        else:
+            result = import_snapshot(client, args.input, args.collection, args.tenant, args.batch_size)
+            print(f"インポート完了: {result['rows']} 件（失敗 {result['failed']} 件）")
+    finally:
+        client.close()  # コネクションを明示的にクローズ
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+テナント別ベクトルストアのハンドル
+Weaviate用の TenantRegistry（app.py）とインメモリ用の MemoryTenantRegistry（offline_backends.py）が共通で使う
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import re
+import time
+from typing import List, Optional
+
+# サードパーティライブラリ
+from fastapi import HTTPException
+from langchain_core.documents import Document
+
+
+# Weaviateのテナント名として使用可能な形式
+TENANT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def validate_tenant_name(tenant: str) -> None:
+    """テナント名の形式を検証"""
+    if not TENANT_NAME_PATTERN.match(tenant):
+        raise HTTPException(status_code=400, detail="無効なテナント名です（英数字・-・_ の64文字以内）")
+
+
+class TenantVectorStore:
+    """
+    テナントを固定したベクトルストアのハンドル。
+    WeaviateVectorStore と同じメソッド名で、テナント指定を自動付与する。
+    in_use は利用中のリクエスト数で、0 の間だけオフロードの対象になる。
+    """
+
+    def __init__(self, store, tenant: str, chunk_count: int):
+        self.store = store
+        self.tenant = tenant
+        self.chunk_count = chunk_count
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None, **kwargs):
+        self.last_used = time.monotonic()
+        ids = self.store.add_texts(texts, metadatas=metadatas, tenant=self.tenant, **kwargs)
+        self.chunk_count += len(texts)
+        return ids
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        self.last_used = time.monotonic()
+        return self.store.similarity_search_by_vector(embedding, k=k, tenant=self.tenant, **kwargs)
@@ -0,0 +1,46 @@
+"""
+テスト共通設定
+Weaviate・Embeddingモデル・LLM APIを使わず、インメモリ構成のバックエンドに差し替えてアプリを動かす
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app の読み込み前にオフライン構成を指定する
+os.environ["VECTOR_STORE_BACKEND"] = "memory"
+os.environ["EMBEDDING_BACKEND"] = "hashing"
+os.environ["UPLOADED_FILES_DIR"] = tempfile.mkdtemp()
+os.environ["SNAPSHOT_DIR"] = tempfile.mkdtemp()
+os.environ.setdefault("TENANT_MAX_CHUNKS", "5")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from langchain_core.runnables import RunnableLambda  # noqa: E402
+
+
+@pytest.fixture
+def backends():
+    """インメモリのベクトルストアと、プロンプトをそのまま回答として返すLLMからなるバックエンド"""
+    from offline_backends import MemoryTenantRegistry, create_embeddings
+
+    embeddings = create_embeddings("hashing")
+    return app_module.Backends(
+        embeddings=embeddings,
+        tenant_registry=MemoryTenantRegistry(embedding=embeddings, max_tenants=app_module.TENANT_MAX_TENANTS),
+        llm_factory=lambda: RunnableLambda(lambda prompt: prompt.to_string())
+    )
+
+
+@pytest.fixture
+def client(backends):
+    """バックエンドを差し替えたテストクライアント"""
+    app_module.app.dependency_overrides[app_module.get_backends] = lambda: backends
+    try:
+        # 起動・終了イベントは実行しない（終了時にレーンのスレッドプールが停止するため）
+        yield TestClient(app_module.app)
+    finally:
+        app_module.app.dependency_overrides.clear()
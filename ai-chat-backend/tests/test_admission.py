@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionLane
+
+
+async def occupy(lane, release: threading.Event):
+    """実行枠を1つ占有するタスクを開始し、実行が始まるまで待つ"""
+    task = asyncio.create_task(lane.run(release.wait))
+    while lane.running == 0:
+        await asyncio.sleep(0.01)
+    return task
+
+
+def test_full_queue_is_rejected_with_429_and_retry_after():
+    async def scenario():
+        lane = AdmissionLane("test", max_concurrency=1, max_queue=1, queue_timeout=5)
+        release = threading.Event()
+        running = await occupy(lane, release)
+        queued = asyncio.create_task(lane.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await lane.run(lambda: "rejected")
+
+        release.set()
+        assert await queued == "queued"
+        await running
+        lane.shutdown()
+        return lane, exc_info.value
+
+    lane, error = asyncio.run(scenario())
+
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+    assert lane.metrics()["rejected_queue_full"] == 1
+
+
+def test_queue_timeout_is_rejected_with_503_and_retry_after():
+    async def scenario():
+        lane = AdmissionLane("test", max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release = threading.Event()
+        running = await occupy(lane, release)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await lane.run(lambda: "timed out")
+
+        release.set()
+        await running
+        lane.shutdown()
+        return lane, exc_info.value
+
+    lane, error = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert lane.metrics()["rejected_timeout"] == 1
+    assert lane.metrics()["queue_depth"] == 0
+
+
+def test_ingest_yields_until_interactive_lane_is_idle():
+    async def scenario():
+        interactive = AdmissionLane("interactive", max_concurrency=1, max_queue=4, queue_timeout=5)
+        ingest = AdmissionLane("ingest", max_concurrency=1, max_queue=4, queue_timeout=5)
+        release = threading.Event()
+        running = await occupy(interactive, release)
+
+        def batch():
+            started_at = time.monotonic()
+            ingest.yield_to(interactive, busy_threshold=1, max_wait=5)
+            return time.monotonic() - started_at
+
+        yielding = asyncio.create_task(ingest.run(batch))
+        await asyncio.sleep(0.1)
+        assert not yielding.done()
+
+        release.set()
+        await running
+        waited = await yielding
+        interactive.shutdown()
+        ingest.shutdown()
+        return ingest, waited
+
+    ingest, waited = asyncio.run(scenario())
+
+    assert 0.1 <= waited < 5
+    assert ingest.metrics()["yields"] == 1
+
+
+def test_yield_is_bounded_by_max_wait():
+    async def scenario():
+        interactive = AdmissionLane("interactive", max_concurrency=1, max_queue=4, queue_timeout=5)
+        ingest = AdmissionLane("ingest", max_concurrency=1, max_queue=4, queue_timeout=5)
+        release = threading.Event()
+        running = await occupy(interactive, release)
+
+        await ingest.run(ingest.yield_to, interactive, 1, 0.05)
+
+        release.set()
+        await running
+        interactive.shutdown()
+        ingest.shutdown()
+        return ingest
+
+    ingest = asyncio.run(scenario())
+
+    assert ingest.metrics()["yields"] == 1
+    assert 0.05 <= ingest.metrics()["yield_wait_seconds"] < 1
@@ -0,0 +1,89 @@
+import app as app_module
+from app import ConversationStore, estimate_tokens, format_history
+
+
+def test_format_history_keeps_latest_turn_when_answer_exceeds_budget():
+    turns = [
+        ("user", "古い質問です"),
+        ("assistant", "古い回答です"),
+        ("user", "候補を3つ挙げてください"),
+        ("assistant", "あ" * 1200),
+    ]
+
+    history = format_history(turns, token_budget=1000)
+
+    assert "User: 候補を3つ挙げてください" in history
+    assert "Assistant: あ" in history
+    assert estimate_tokens(history) <= 1000
+
+
+def test_format_history_orders_oldest_first():
+    turns = [("user", "Q1"), ("assistant", "A1"), ("user", "Q2"), ("assistant", "A2")]
+
+    assert format_history(turns, token_budget=1000) == "User: Q1\nAssistant: A1\nUser: Q2\nAssistant: A2"
+
+
+def test_session_continues_with_server_side_history(client):
+    first = client.post("/ask", json={"question": "What is the first question?"}).json()
+    second = client.post("/ask", json={"question": "And the second one?", "session_id": first["session_id"]}).json()
+
+    assert second["session_id"] == first["session_id"]
+    assert "User: What is the first question?" in second["answer"]
+
+
+def test_unknown_session_id_is_replaced_with_a_new_one(client):
+    response = client.post("/ask", json={"question": "Hello?", "session_id": "client-chosen-id"}).json()
+
+    assert response["session_id"] != "client-chosen-id"
+
+
+def test_session_from_another_tenant_is_not_continued(client):
+    client.post("/ingest", json={"text": "Tenant one document.", "tenant": "session-a"})
+    client.post("/ingest", json={"text": "Tenant two document.", "tenant": "session-b"})
+    first = client.post("/ask", json={"question": "Secret question for tenant one?", "tenant": "session-a"}).json()
+
+    second = client.post("/ask", json={
+        "question": "Anything else?", "session_id": first["session_id"], "tenant": "session-b"
+    }).json()
+
+    assert second["session_id"] != first["session_id"]
+    assert "Secret question for tenant one" not in second["answer"]
+
+
+def test_same_topic_reuses_previous_documents(client, monkeypatch):
+    # 検索クエリを質問そのものにして、同じ質問なら同じ話題と判定させる
+    monkeypatch.setattr(app_module, "condense_question", lambda llm, question, history, language: question)
+    client.post("/ingest", json={"text": "The reuse code is alpha.", "tenant": "reuse"})
+    first = client.post("/ask", json={"question": "What is the reuse code?", "tenant": "reuse"}).json()
+    client.post("/ingest", json={"text": "The reuse code is beta.", "tenant": "reuse"})
+
+    same_topic = client.post("/ask", json={
+        "question": "What is the reuse code?", "session_id": first["session_id"], "tenant": "reuse"
+    }).json()
+    other_filter = client.post("/ask", json={
+        "question": "What is the reuse code?", "session_id": first["session_id"], "tenant": "reuse",
+        "auto_language_filter": False
+    }).json()
+
+    assert "The reuse code is beta." not in same_topic["answer"]
+    assert "The reuse code is beta." in other_filter["answer"]
+
+
+def test_expired_sessions_are_evicted():
+    store = ConversationStore(max_sessions=10, ttl_seconds=0, max_turns=5)
+    session_id, _ = store.get_or_create(None)
+
+    new_session_id, _ = store.get_or_create(session_id)
+
+    assert new_session_id != session_id
+
+
+def test_least_recently_used_session_is_evicted_over_capacity():
+    store = ConversationStore(max_sessions=2, ttl_seconds=3600, max_turns=5)
+    oldest, _ = store.get_or_create(None)
+    recent, _ = store.get_or_create(None)
+    store.get_or_create(oldest)
+    store.get_or_create(None)
+
+    assert store.get_or_create(oldest)[0] == oldest
+    assert store.get_or_create(recent)[0] != recent
@@ -0,0 +1,42 @@
+from langchain_core.documents import Document
+
+from app import SearchFilters, build_search_filter, retrieve_documents
+
+
+def test_build_search_filter_returns_backend_neutral_conditions():
+    conditions = build_search_filter(SearchFilters(source_type="pdf"), "ja")
+
+    assert conditions == [("language", "equal", "ja"), ("source_type", "equal", "pdf")]
+
+
+def test_build_search_filter_without_conditions_returns_none():
+    assert build_search_filter(None, None) is None
+
+
+def test_memory_store_applies_conditions(client):
+    client.post("/ingest", json={"text": "The policy document from the wiki.", "source": "wiki", "tenant": "filters"})
+    client.post("/ingest", json={"text": "The policy document from the manual.", "source": "manual", "tenant": "filters"})
+
+    response = client.post("/ask", json={
+        "question": "What is the policy document?",
+        "tenant": "filters",
+        "filters": {"source": "manual"}
+    })
+
+    answer = response.json()["answer"]
+    assert "from the manual" in answer
+    assert "from the wiki" not in answer
+
+
+def test_retrieve_documents_retries_without_filters_on_filter_error():
+    class StoreWithoutMetadata:
+        """メタデータ用プロパティが無いコレクションと同様に、絞り込み時だけ失敗する"""
+
+        def similarity_search_by_vector(self, embedding, k=4, filters=None):
+            if filters:
+                raise ValueError("Error during query: no such prop with name 'language' found")
+            return [Document(page_content="legacy chunk")]
+
+    docs = retrieve_documents(StoreWithoutMetadata(), [0.1], None, "en")
+
+    assert [doc.page_content for doc in docs] == ["legacy chunk"]
@@ -0,0 +1,77 @@
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from snapshot import export_collection, import_snapshot, iter_snapshot, read_snapshot_info
+
+
+def make_object(i):
+    return SimpleNamespace(
+        uuid=uuid.uuid4(),
+        vector=[0.1 * i, 0.2, 0.3],
+        properties={
+            "text": f"chunk {i}",
+            "language": "en",
+            "source": "test",
+            "source_type": "text",
+            "ingested_at": "2025-01-01T00:00:00Z",
+        },
+    )
+
+
+class StubCollection:
+    """単一テナントのコレクション（エクスポート・インポートに必要な部分のみ）"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.config = SimpleNamespace(
+            get=lambda: SimpleNamespace(multi_tenancy_config=SimpleNamespace(enabled=False))
+        )
+        self.tenants = SimpleNamespace(get=lambda: {})
+        self.query = SimpleNamespace(
+            fetch_objects=lambda limit, include_vector: SimpleNamespace(objects=self.objects[:limit])
+        )
+
+    def iterator(self, include_vector):
+        return iter(self.objects)
+
+
+def stub_client(collection):
+    return SimpleNamespace(collections=SimpleNamespace(get=lambda name: collection, exists=lambda name: True))
+
+
+def test_export_round_trip(tmp_path):
+    output_path = str(tmp_path / "kb.parquet")
+
+    result = export_collection(stub_client(StubCollection([make_object(i) for i in range(5)])), "Index", output_path,
+                               batch_size=2)
+
+    assert result["rows"] == 5
+    assert not (tmp_path / "kb.parquet.tmp").exists()
+    info = read_snapshot_info(output_path)
+    assert info["rows"] == 5 and info["dim"] == "3" and info["collection"] == "Index"
+    assert pq.read_schema(output_path).field("vector").type == pa.list_(pa.float32(), 3)
+
+    rows = [row for batch in iter_snapshot(output_path, batch_size=2) for row in zip(*batch)]
+    assert len(rows) == 5
+    _, text, metadata, vector, tenant = rows[1]
+    assert text == "chunk 1"
+    assert tenant is None
+    assert vector == pytest.approx([0.1, 0.2, 0.3])
+    assert metadata["ingested_at"] == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert metadata["ingested_at"].tzinfo is not None
+
+
+def test_import_rejects_dimension_mismatch(tmp_path):
+    output_path = str(tmp_path / "kb.parquet")
+    export_collection(stub_client(StubCollection([make_object(1)])), "Index", output_path)
+    target = StubCollection([SimpleNamespace(uuid=uuid.uuid4(), vector=[0.0] * 384, properties={})])
+
+    with pytest.raises(ValueError, match="次元数"):
+        import_snapshot(stub_client(target), output_path)
+    with pytest.raises(ValueError, match="次元数"):
+        import_snapshot(stub_client(StubCollection([])), output_path, expected_dim=384)
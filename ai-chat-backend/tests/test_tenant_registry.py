@@ -0,0 +1,126 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+
+from app import TenantRegistry
+
+
+class FakeTenants:
+    """collection.tenants の代わりに活性状態を記録する"""
+
+    def __init__(self, names):
+        self.status = {name: TenantActivityStatus.COLD for name in names}
+        self.cold_updates = []
+
+    def get(self):
+        return {name: Tenant(name=name, activity_status=status) for name, status in self.status.items()}
+
+    def get_by_name(self, name):
+        return self.get().get(name)
+
+    def create(self, tenants):
+        for tenant in tenants:
+            self.status[tenant.name] = TenantActivityStatus.HOT
+
+    def update(self, tenants):
+        for tenant in tenants:
+            self.status[tenant.name] = tenant.activity_status
+            if tenant.activity_status.value in ("COLD", "INACTIVE"):
+                self.cold_updates.append(tenant.name)
+
+    def is_hot(self, name):
+        return self.status[name].value in ("HOT", "ACTIVE")
+
+
+class FakeCollection:
+    def __init__(self, names):
+        self.tenants = FakeTenants(names)
+
+    def with_tenant(self, name):
+        count = SimpleNamespace(total_count=0)
+        return SimpleNamespace(aggregate=SimpleNamespace(over_all=lambda total_count: count))
+
+
+@pytest.fixture
+def make_registry():
+    def make(names, max_active=10, idle_seconds=3600, max_tenants=1000):
+        collection = FakeCollection(names)
+        registry = TenantRegistry(None, collection, None, max_active, idle_seconds, max_tenants)
+        return registry, collection.tenants
+
+    return make
+
+
+def test_cold_tenant_is_activated_on_use(make_registry):
+    registry, tenants = make_registry(["a"])
+
+    with registry.use("a") as store:
+        assert store.tenant == "a"
+        assert tenants.is_hot("a")
+
+
+def test_idle_tenant_is_offloaded(make_registry):
+    registry, tenants = make_registry(["a", "b"], idle_seconds=0.01)
+    with registry.use("a"):
+        pass
+    time.sleep(0.02)
+
+    with registry.use("b"):
+        pass
+
+    assert tenants.cold_updates == ["a"]
+    assert not tenants.is_hot("a")
+
+
+def test_max_active_is_enforced_least_recently_used_first(make_registry):
+    registry, tenants = make_registry(["a", "b", "c"], max_active=2)
+    for name in ["a", "b", "c"]:
+        with registry.use(name):
+            pass
+
+    assert tenants.cold_updates == ["a"]
+    assert tenants.is_hot("b") and tenants.is_hot("c")
+
+
+def test_leased_tenant_is_never_offloaded(make_registry):
+    registry, tenants = make_registry(["a", "b", "c"], max_active=1, idle_seconds=0)
+
+    with registry.use("a"):
+        with registry.use("b"):
+            pass
+        with registry.use("c"):
+            pass
+        assert "a" not in tenants.cold_updates
+        assert tenants.is_hot("a")
+
+    with registry.use("b"):
+        pass
+    assert "a" in tenants.cold_updates
+
+
+def test_evicted_tenants_are_offloaded_when_activation_fails(make_registry):
+    registry, tenants = make_registry(["a", "b"], idle_seconds=0.01)
+    for name in ["a", "b"]:
+        with registry.use(name):
+            pass
+    time.sleep(0.02)
+
+    with pytest.raises(HTTPException) as exc_info:
+        with registry.use("missing"):
+            pass
+
+    assert exc_info.value.status_code == 404
+    assert sorted(tenants.cold_updates) == ["a", "b"]
+
+
+def test_tenant_count_quota_is_enforced_on_create(make_registry):
+    registry, _ = make_registry(["a"], max_tenants=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        with registry.use("b", create=True):
+            pass
+
+    assert exc_info.value.status_code == 403
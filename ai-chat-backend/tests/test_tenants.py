@@ -0,0 +1,29 @@
+def test_ask_only_retrieves_requested_tenant_chunks(client):
+    tenants = [f"isolation-{i}" for i in range(120)]
+    for tenant in tenants:
+        response = client.post("/ingest", json={"text": f"The secret code of {tenant} is kept here.", "tenant": tenant})
+        assert response.status_code == 200
+        assert response.json()["status"] == "success"
+
+    for tenant in tenants:
+        response = client.post("/ask", json={"question": "What is the secret code?", "tenant": tenant})
+        assert response.status_code == 200
+        answer = response.json()["answer"]
+        assert f"The secret code of {tenant} is" in answer
+        assert answer.count("The secret code of isolation-") == 1
+
+
+def test_ask_unknown_tenant_returns_404(client):
+    response = client.post("/ask", json={"question": "What is the secret code?", "tenant": "missing-tenant"})
+
+    assert response.status_code == 404
+
+
+def test_ingest_over_chunk_quota_returns_403(client):
+    for i in range(5):
+        response = client.post("/ingest", json={"text": f"Document number {i}.", "tenant": "quota"})
+        assert response.status_code == 200
+
+    response = client.post("/ingest", json={"text": "One document too many.", "tenant": "quota"})
+
+    assert response.status_code == 403
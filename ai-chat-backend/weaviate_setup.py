@@ -0,0 +1,120 @@
+"""
+Weaviateの接続・スキーマ共通処理
+app.py・init_weaviate.py・snapshot.py から同じ接続設定とプロパティ定義を使う
+"""
+
+###########################################################
+# ライブラリインポート
+###########################################################
+# 標準ライブラリ
+import os
+from typing import Tuple
+
+# サードパーティライブラリ
+import weaviate
+from weaviate.classes.config import Configure, DataType, Property, Tokenization
+from weaviate.embedded import EmbeddedOptions
+
+
+def parse_weaviate_url(weaviate_url: str) -> Tuple[str, int]:
+    """WEAVIATE_URL からホストとポートを抽出（ポート省略時はスキームに応じて 80 / 443）"""
+    if weaviate_url.startswith("http://"):
+        http_host = weaviate_url[7:]
+        http_secure = False
+    elif weaviate_url.startswith("https://"):
+        http_host = weaviate_url[8:]
+        http_secure = True
+    else:
+        http_host = weaviate_url
+        http_secure = False
+
+    if ":" in http_host:
+        http_host, http_port = http_host.split(":")
+        return http_host, int(http_port)
+    return http_host, 443 if http_secure else 80
+
+
+def connect_weaviate(embedded_fallback: bool = True) -> weaviate.WeaviateClient:
+    """
+    環境変数 WEAVIATE_URL のWeaviateに接続。
+    embedded_fallback=True の場合、接続に失敗したら組み込みモードで起動する。
+    """
+    http_host, http_port = parse_weaviate_url(os.getenv("WEAVIATE_URL", "http://localhost:8080"))
+    try:
+        client = weaviate.connect_to_local(
+            host=http_host,
+            port=http_port,
+            grpc_port=50051
+        )
+        print("既存のWeaviateインスタンスに接続しました")
+        return client
+    except Exception as e:
+        if not embedded_fallback:
+            raise
+        print(f"既存インスタンスへの接続に失敗しました: {e}")
+
+    try:
+        client = weaviate.WeaviateClient(
+            embedded_options=EmbeddedOptions(
+                hostname="localhost",
+                port=8090,
+                grpc_port=50052,
+                persistence_data_path="./weaviate_data"
+            )
+        )
+        print("Weaviateを組み込みモードで起動しました（ポート8090）")
+        return client
+    except Exception as e:
+        print(f"組み込みモードの初期化にも失敗しました: {e}")
+        raise RuntimeError("Weaviateの初期化に完全に失敗しました")
+
+
+# コレクション共通のプロパティ定義
+# メタデータは検索時の事前絞り込みに使うため、フィルタ用インデックスのみ有効化し
+# 全文検索（BM25）用インデックスは作らない。値は完全一致で比較するため FIELD 分割とする
+properties = [
+    Property(name="text", data_type=DataType.TEXT),
+    Property(name="language", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+             index_filterable=True, index_searchable=False),
+    Property(name="source", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+             index_filterable=True, index_searchable=False),
+    Property(name="source_type", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+             index_filterable=True, index_searchable=False),
+    Property(name="ingested_at", data_type=DataType.DATE, index_filterable=True),
+]
+
+
+def add_missing_properties(client: weaviate.WeaviateClient, name: str) -> None:
+    """
+    既存コレクションに不足しているメタデータプロパティを追加。
+    自動スキーマで作成済みのプロパティは分割方式を変更できないため警告のみ表示する。
+    """
+    collection = client.collections.get(name)
+    existing = {prop.name: prop for prop in collection.config.get().properties}
+    for prop in properties:
+        current = existing.get(prop.name)
+        if current is None:
+            collection.config.add_property(prop)
+            print(f"{name} にプロパティ {prop.name} を追加しました")
+        elif prop.tokenization is not None and current.tokenization != prop.tokenization:
+            print(
+                f"警告: {name} のプロパティ {prop.name} の分割方式が {current.tokenization} です"
+                f"（想定: {prop.tokenization}）。スナップショットで再作成してください"
+            )
+
+
+def ensure_collection(client: weaviate.WeaviateClient, name: str, multi_tenancy: bool = False) -> bool:
+    """
+    共通のプロパティ定義でコレクションを作成し、既存の場合は不足プロパティを補完する。
+    新規作成した場合は True を返す。
+    """
+    if not client.collections.exists(name):
+        client.collections.create(
+            name=name,
+            properties=properties,
+            vectorizer_config=None,
+            multi_tenancy_config=Configure.multi_tenancy(enabled=True) if multi_tenancy else None
+        )
+        return True
+    add_missing_properties(client, name)
+    return False
@@ -40,6 +40,17 @@ export async function POST(request: NextRequest) {
       }),
     })
 
+    // 混雑による拒否（429/503）は Retry-After を付けてそのまま返す
+    if (response.status === 429 || response.status === 503) {
+      return NextResponse.json(
+        {
+          success: false,
+          message: "サーバーが混雑しています。しばらくしてから再度お試しください",
+        },
+        { status: response.status, headers: { "Retry-After": response.headers.get("Retry-After") ?? "1" } },
+      )
+    }
+
     if (!response.ok) {
       throw new Error(`FastAPI エラー: ${response.status}`)
     }
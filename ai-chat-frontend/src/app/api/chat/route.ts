@@ -2,6 +2,7 @@ import { type NextRequest, NextResponse } from "next/server"
 
 interface ChatRequest {
   message: string
+  sessionId?: string | null
   history: Array<{
     role: "user" | "assistant"
     content: string
@@ -38,9 +39,22 @@ export async function POST(request: NextRequest) {
         // ...(apiKey && { "X-API-Key": apiKey }),
       },
       // body: JSON.stringify({"question": "LangChainとは何ですか？"}),
-      body: JSON.stringify({"question": apiRequestBody.message}),
+      body: JSON.stringify({
+        question: apiRequestBody.message,
+        // サーバー側の会話セッションを引き継ぐ（新規時は履歴を初期値として渡す）
+        session_id: body.sessionId ?? null,
+        conversation_history: apiRequestBody.conversation_history,
+      }),
     })
 
+    // 混雑による拒否（429/503）は Retry-After を付けてそのまま返す
+    if (response.status === 429 || response.status === 503) {
+      return NextResponse.json(
+        { error: "サーバーが混雑しています。しばらくしてから再度お試しください" },
+        { status: response.status, headers: { "Retry-After": response.headers.get("Retry-After") ?? "1" } },
+      )
+    }
+
     if (!response.ok) {
       throw new Error(`カスタムAPI エラー: ${response.status} ${response.statusText}`)
     }
@@ -51,6 +65,7 @@ export async function POST(request: NextRequest) {
     return NextResponse.json({
       // response: data.response || data.message || data.text || "回答を取得できませんでした",
       response: data.answer || "回答を取得できませんでした",
+      sessionId: data.session_id,
       // 必要に応じて他の情報も返す
       usage: data.usage,
       model: data.model,
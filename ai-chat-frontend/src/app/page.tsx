@@ -22,6 +22,7 @@ export default function ChatPage() {
   const [input, setInput] = useState("")
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
+  const [sessionId, setSessionId] = useState<string | null>(null)
   const scrollAreaRef = useRef<HTMLDivElement>(null)
 
   // 新しいメッセージが追加されたときに自動スクロール
@@ -56,6 +57,7 @@ export default function ChatPage() {
         },
         body: JSON.stringify({
           message: userMessage.content,
+          sessionId,
           history: messages.map((msg) => ({
             role: msg.role,
             content: msg.content,
@@ -68,6 +70,9 @@ export default function ChatPage() {
       }
 
       const data = await response.json()
+      if (data.sessionId) {
+        setSessionId(data.sessionId)
+      }
 
       const assistantMessage: Message = {
         id: (Date.now() + 1).toString(),
@@ -86,6 +91,7 @@ export default function ChatPage() {
 
   const clearChat = () => {
     setMessages([])
+    setSessionId(null)
     setError(null)
   }
 